@@ -0,0 +1,154 @@
+"""
+core/answer_cache.py
+
+Semantic cache of validated document answers, kept as a Chroma index in the
+session folder. A cached answer is only returned while the chunks it was
+based on are unchanged.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import chromadb
+import core.config as config
+
+COLLECTION_NAME = "answers"
+
+# Words that point back into the conversation ("what about its second chapter?").
+REFERRING_WORDS = re.compile(
+    r"\b(it|its|it's|they|them|their|theirs|he|him|his|she|her|hers|former|latter|"
+    r"above|previous|earlier|again|also|else|another|same|more)\b"
+    r"|^\s*(and|but|so|or|what about|how about)\b"
+    r"|\b(this|that|these|those)\b(?=\s*(?:[?.!,]|$|one\b|ones\b|is\b|are\b|was\b|were\b|means?\b|does\b|do\b))",
+    re.IGNORECASE
+)
+# Question words and fillers; a question made only of these ("why?", "how so?")
+# has no subject of its own.
+FILLER_WORDS = {
+    "what", "why", "how", "when", "where", "who", "which", "whom", "whose", "is", "are",
+    "was", "were", "do", "does", "did", "can", "could", "would", "should", "will", "the",
+    "a", "an", "of", "to", "in", "on", "so", "please", "explain", "tell", "me", "really",
+    "ok", "okay", "yes", "no", "example", "examples", "why's", "what's", "how's"
+}
+
+_client = None
+_collection = None
+_folder = None
+_lock = threading.Lock()
+
+def get_collection():
+    """
+    The session's answer cache, reopened when the session changes.
+    """
+    global _client, _collection, _folder
+    folder = config.session_folder()
+    if _collection is None or folder != _folder:
+        _client = chromadb.PersistentClient(path=os.path.join(folder, "answer_cache"))
+        _collection = _client.get_or_create_collection(
+            name=COLLECTION_NAME, metadata={"hnsw:space": "cosine"}
+        )
+        _folder = folder
+    return _collection
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def standalone(question: str) -> bool:
+    """
+    True if the question can be understood without the conversation: it names a
+    subject of its own and has no pronoun or phrase referring back to earlier turns.
+    """
+    if REFERRING_WORDS.search(question):
+        return False
+    words = re.findall(r"[\w']+", question.lower())
+    return any(w not in FILLER_WORDS for w in words)
+
+def cacheable(question: str) -> bool:
+    """
+    Only standalone questions are cached and answered from cache; follow-ups
+    depend on the conversation rather than the documents.
+    """
+    return config.ANSWER_CACHE_ENABLED and standalone(question)
+
+def sources_current(source_collection, ids: list, hashes: list) -> bool:
+    """
+    True if every chunk is still in the collection with the same content.
+    """
+    got = source_collection.get(ids=ids, include=["documents"])
+    current = {i: chunk_hash(d or "") for i, d in zip(got["ids"], got["documents"])}
+    return all(current.get(i) == h for i, h in zip(ids, hashes))
+
+def lookup(collection_name: str, source_collection, question: str, embedding: list):
+    """
+    Returns {"question", "answer", "ids", "similarity"} for the closest cached
+    answer in this collection, or None if there is no close or current one.
+    """
+    if not cacheable(question):
+        return None
+    with _lock:
+        try:
+            cache = get_collection()
+            results = cache.query(
+                query_embeddings=[embedding],
+                n_results=1,
+                where={"collection": collection_name},
+                include=["documents", "distances", "metadatas"]
+            )
+        except Exception as e:
+            print(f"[AnswerCache] Lookup failed: {e}")
+            return None
+        if not results["ids"] or not results["ids"][0]:
+            return None
+        entry_id = results["ids"][0][0]
+        similarity = 1.0 - results["distances"][0][0]
+        meta = results["metadatas"][0][0]
+        if similarity < config.ANSWER_CACHE_SIMILARITY:
+            return None
+        ids = json.loads(meta["chunk_ids"])
+        try:
+            current = sources_current(source_collection, ids, json.loads(meta["chunk_hashes"]))
+        except Exception as e:
+            print(f"[AnswerCache] Could not check source chunks: {e}")
+            return None
+        if not current:
+            print("[AnswerCache] Source chunks changed; dropping cached answer.")
+            try:
+                cache.delete(ids=[entry_id])
+            except Exception as e:
+                print(f"[AnswerCache] Could not drop entry: {e}")
+            return None
+    print(f"[AnswerCache] Hit ({similarity:.3f}) for: {results['documents'][0][0]}")
+    return {
+        "question": results["documents"][0][0],
+        "answer": meta["answer"],
+        "ids": ids,
+        "similarity": similarity
+    }
+
+def store(collection_name: str, question: str, embedding: list, answer: str, sources: list) -> None:
+    """
+    Caches an accepted answer. sources holds (chunk_id, chunk_text) pairs of the
+    chunks it was generated from.
+    """
+    if not cacheable(question) or not sources:
+        return
+    entry_id = chunk_hash(f"{collection_name}\0{' '.join(question.lower().split())}")
+    with _lock:
+        try:
+            get_collection().upsert(
+                ids=[entry_id],
+                documents=[question],
+                embeddings=[embedding],
+                metadatas=[{
+                    "collection": collection_name,
+                    "answer": answer,
+                    "chunk_ids": json.dumps([i for i, _ in sources]),
+                    "chunk_hashes": json.dumps([chunk_hash(t) for _, t in sources]),
+                    "stored_at": time.time()
+                }]
+            )
+        except Exception as e:
+            print(f"[AnswerCache] Could not store answer: {e}")
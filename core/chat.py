@@ -1,25 +1,15 @@
 import os
 import json
 import subprocess
-import ollama
 import re
-import sys
 import time
 import threading
 import queue
 import requests  # NEW: We'll poll the front-end messages
 import core.config as config
 import core.db_utils as db_utils
-from core.config import CHAT_HISTORY_FILE
-from core.web_search import (
-    web_search_flow,
-    wikipedia_flow,
-    duckduckgo_search,
-    gather_news_articles,
-    extract_publication_date,
-    scrape_webpage,
-    summarize_article_content
-)
+from core import llm, memory, answer_cache
+from core.web_search import web_search_flow, plan_search, default_plan
 import sys_msgs
 import shutil
 
@@ -147,7 +137,7 @@ def do_incremental_summary(text_chunk: str) -> str:
         "Output only the summary. Do not include any additional commentary."
     )
     try:
-        resp = ollama.generate(model=config.MODEL, prompt=summary_prompt)
+        resp = llm.generate(summary_prompt, task="memory")
         summary = resp.get("response", "[No summary generated]")
         summary = db_utils.remove_think_clauses(summary)
         return summary
@@ -164,6 +154,14 @@ def summarize_if_needed():
         db_utils.save_session_state()
         messages_since_summary = 0
 
+def update_memory_summary_in_background():
+    """
+    Hands the pending messages to the summary fallback without blocking the chat.
+    """
+    pending = list(unsummarized_messages)
+    unsummarized_messages.clear()
+    llm.submit(db_utils.update_memory_summary, pending, background=True)
+
 def finalize_leftover_messages():
     if unsummarized_messages:
         db_utils.update_memory_summary(unsummarized_messages)
@@ -183,52 +181,122 @@ def validate_answer(answer: str, user_query: str) -> bool:
         "Is this answer satisfactory, accurate, and up-to-date? "
         "Output only 'yes' or 'no'."
     )
-    resp = ollama.chat(
-        model=config.MODEL,
-        messages=[
-            {"role": "system", "content": sys_msgs.answer_validation_msg},
-            {"role": "user", "content": validation_prompt}
-        ]
-    )
+    resp = llm.chat([
+        {"role": "system", "content": sys_msgs.answer_validation_msg},
+        {"role": "user", "content": validation_prompt}
+    ], task="validate")
     raw_validation = resp["message"]["content"].strip()
-    val = db_utils.remove_think_clauses(raw_validation).lower()
+    val = db_utils.remove_think_clauses(raw_validation).lower().strip(" .!'\"")
     print(f"[validate_answer] validation: '{val}'")
     return val == "yes"
 
 def master_answer_flow(user_input: str) -> str:
-    if db_utils.active_collection:
-        db_ans = db_utils.rag_ollama_chat(user_input)
-        if db_ans and not db_ans.lower().startswith("i couldn't find relevant info"):
-            if validate_answer(db_ans, user_input):
-                return "[source: document]\n" + db_ans
-
-    if should_search():
-        web_ans = web_search_flow(user_input)
-        if web_ans.strip():
-            return "[source: web]\nI retrieved external information:\n\n" + web_ans
-
-    internal_ans = db_utils.normal_ollama_chat(user_input)
-    if validate_answer(internal_ans, user_input):
-        return "[source: internal]\n" + internal_ans
-    return "[source: internal]\n" + internal_ans
+    """
+    Answers one turn within config.TURN_DEADLINE seconds. If the budget runs out,
+    the best answer so far is returned (a document answer that was not validated
+    yet); without one, the plain answer gets TURN_FALLBACK_SECONDS of its own.
+    """
+    with llm.turn(label=user_input):
+        best = None
+        try:
+            if db_utils.active_collection:
+                rag = db_utils.rag_answer(user_input)
+                db_ans = rag["answer"]
+                if db_ans and not db_ans.lower().startswith("i couldn't find relevant info"):
+                    best = "[source: document]\n" + db_ans
+                    # Cached answers were validated when they were stored.
+                    if rag["cached"]:
+                        return best
+                    if validate_answer(db_ans, user_input):
+                        answer_cache.store(rag["collection"], user_input, rag["embedding"],
+                                           db_ans, rag["sources"])
+                        return best
+
+            # One planning call decides on search, query and source together.
+            plan = plan_search(user_input)
+            needs_search = plan["needs_search"] if plan else should_search()
+            if needs_search:
+                # A failed planner is not asked again inside the web search.
+                web_ans = web_search_flow(user_input, plan or default_plan(user_input))
+                if web_ans.strip():
+                    return "[source: web]\nI retrieved external information:\n\n" + web_ans
+
+            return "[source: internal]\n" + db_utils.normal_ollama_chat(user_input)
+        except llm.DeadlineExceeded:
+            if best:
+                print("[Chat] Out of time; returning the document answer without validation.")
+                return best
+
+        print("[Chat] Out of time; answering without documents or web results.")
+        llm.extend_deadline(config.TURN_FALLBACK_SECONDS)
+        try:
+            return "[source: internal]\n" + db_utils.normal_ollama_chat(user_input)
+        except llm.DeadlineExceeded:
+            return "[source: internal]\nSorry, I could not answer in time. Please try asking again."
 
 def should_search() -> bool:
     if not db_utils.chat_history:
         return False
     user_message = db_utils.chat_history[-1]
     sys_prompt = sys_msgs.search_or_not_msg
-    response = ollama.chat(
-        model=config.MODEL,
-        messages=[
-            {"role": "system", "content": sys_msgs.search_or_not_msg},
-            user_message
-        ]
-    )
+    response = llm.chat([
+        {"role": "system", "content": sys_msgs.search_or_not_msg},
+        user_message
+    ], task="classify")
     raw_content = response["message"]["content"]
-    content = db_utils.remove_think_clauses(raw_content).strip().lower()
+    content = db_utils.remove_think_clauses(raw_content).strip().lower().strip(" .!'\"")
     print(f"[search_or_not] LLM response: '{content}'")
     return content == "true"
 
+def build_question_bank_in_background():
+    """
+    Pre-generates the MCQ bank of the active collection at background priority,
+    so a later (mcq ...) command can be served from it.
+    """
+    session_folder = config.session_folder()
+    if not db_utils.active_collection:
+        return
+    from core import mcq
+    llm.submit(
+        mcq.build_question_bank,
+        db_utils.active_collection,
+        db_utils.active_collection_name,
+        session_folder,
+        background=True
+    )
+
+def prefetch_answer(question: str, collection, collection_name: str) -> None:
+    """
+    Answers a suggested question from the collection and, if the answer passes
+    validation, stores it in the answer cache for when the user asks it.
+    """
+    try:
+        rag = db_utils.rag_answer(question, collection, collection_name)
+        if rag["cached"] or not rag["sources"]:
+            return
+        if validate_answer(rag["answer"], question):
+            answer_cache.store(collection_name, question, rag["embedding"], rag["answer"], rag["sources"])
+            print(f"[Chat] Prefetched answer for suggested question: {question}")
+    except Exception as e:
+        print(f"[Chat] Could not prefetch answer for '{question}': {e}")
+
+def prefetch_suggested_answers_in_background(summary_text: str):
+    """
+    Answers the questions suggested at the end of the collection summary at
+    background priority, so picking one is served from the answer cache.
+    """
+    if not summary_text or not db_utils.active_collection:
+        return
+    from core.summarizer import parse_suggested_questions
+    for question in parse_suggested_questions(summary_text):
+        llm.submit(
+            prefetch_answer,
+            question,
+            db_utils.active_collection,
+            db_utils.active_collection_name,
+            background=True
+        )
+
 def process_injected_file_command():
     global messages_since_summary
 
@@ -257,15 +325,20 @@ def process_injected_file_command():
             new_coll_name = db_utils.sanitize_collection_name(pdf_base)
             db_utils.load_collection(new_coll_name)
             if db_utils.active_collection:
-                db_utils.auto_summarize_and_suggest()
+                summary = db_utils.auto_summarize_and_suggest()
+                build_question_bank_in_background()
+                prefetch_suggested_answers_in_background(summary)
 
 def main(final_pdf_path=None):
     global messages_since_summary, last_input_time, next_chat_session
     last_input_time = time.time()
+    from core import rerank
+    rerank.warm_up()
     BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-    if os.path.exists(CHAT_HISTORY_FILE):
+    history_file = config.chat_history_file()
+    if os.path.exists(history_file):
         try:
-            with open(CHAT_HISTORY_FILE, "r", encoding="utf-8") as f:
+            with open(history_file, "r", encoding="utf-8") as f:
                 data = json.load(f)
                 db_utils.chat_history[:] = data.get("chat_history", [])
         except Exception as e:
@@ -297,7 +370,9 @@ def main(final_pdf_path=None):
         new_coll_name = db_utils.sanitize_collection_name(pdf_base)
         db_utils.load_collection(new_coll_name)
         if db_utils.active_collection:
-            db_utils.auto_summarize_and_suggest()
+            summary = db_utils.auto_summarize_and_suggest()
+            build_question_bank_in_background()
+            prefetch_suggested_answers_in_background(summary)
 
     while True:
         remaining = INACTIVITY_TIMEOUT - (time.time() - last_input_time)
@@ -335,34 +410,19 @@ def main(final_pdf_path=None):
             return next_chat_session
         
 
-        # MCQ trigger
-        # inside your input loop in chat.main(), replace the MCQ block with:
+        # MCQ trigger: (mcq), (mcq topic=...), (mcq title=...)
         if user_input.strip().lower().startswith("(mcq"):
-            session_id = os.environ.get("SESSION_ID", "")
-            if not session_id:
-                print("[MCQ] No session_id found. Cannot generate MCQs.")
-                continue
-
-            mcq_match = re.match(r'^\(\s*mcq(?:\s+(.*))?\)$', user_input.strip(), re.IGNORECASE)
-            extra = mcq_match.group(1) if mcq_match else None
-
-            print("[Chat] Generating MCQs in a separate process...")
-            script = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "tools", "MCQ.py"))
-            cmd = [sys.executable, script, session_id]
-            if extra:
-                extra = extra.strip()
-                tm = re.match(r'^topic\s*=\s*(.+)$', extra, re.IGNORECASE)
-                if tm:
-                    cmd += ["--topic", tm.group(1).strip()]
-                else:
-                    tm2 = re.match(r'^title\s*=\s*(.+)$', extra, re.IGNORECASE)
-                    if tm2:
-                        cmd += ["--title", tm2.group(1).strip().strip('"').strip("'")]
-
+            from core import mcq
+            topic, title = mcq.parse_mcq_command(user_input)
+            print("[Chat] Generating MCQs...")
             try:
-                subprocess.run(cmd, check=True)
-                print("[Chat] MCQ generation complete.\n")
-            except subprocess.CalledProcessError as e:
+                quiz = mcq.generate_quiz(topic=topic, title=title or "", save=True)
+                if quiz["mcqs"]:
+                    print(mcq.format_quiz(quiz))
+                    print("[Chat] MCQ generation complete.\n")
+                else:
+                    print(f"[MCQ] {quiz['error']}.\n")
+            except Exception as e:
                 print(f"[MCQ] Error generating MCQs: {e}")
             continue
 
@@ -520,9 +580,9 @@ def main(final_pdf_path=None):
             unsummarized_messages.append({"role": "assistant", "content": answer})
             db_utils.save_session_state()
             messages_since_summary += 1
+            memory.index_history(db_utils.chat_history)
             if len(unsummarized_messages) >= MEMORY_UPDATE_THRESHOLD:
-                db_utils.update_memory_summary(unsummarized_messages)
-                unsummarized_messages.clear()
+                update_memory_summary_in_background()
 
             continue
         # ----- End STT Command Handling -----
@@ -568,7 +628,9 @@ def main(final_pdf_path=None):
                 new_coll_name = db_utils.sanitize_collection_name(pdf_base)
                 db_utils.load_collection(new_coll_name)
                 if db_utils.active_collection:
-                    db_utils.auto_summarize_and_suggest()
+                    summary = db_utils.auto_summarize_and_suggest()
+                    build_question_bank_in_background()
+                    prefetch_suggested_answers_in_background(summary)
                 continue
             else:
                 print("Please specify file path in parentheses: file (C:\\path\\to\\doc.pdf)")
@@ -588,6 +650,6 @@ def main(final_pdf_path=None):
         messages_since_summary += 1
         summarize_if_needed()
 
+        memory.index_history(db_utils.chat_history)
         if len(unsummarized_messages) >= MEMORY_UPDATE_THRESHOLD:
-            db_utils.update_memory_summary(unsummarized_messages)
-            unsummarized_messages.clear()
+            update_memory_summary_in_background()
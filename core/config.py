@@ -2,9 +2,170 @@ import os
 import re
 
 CHAT_HISTORY_FILE = os.getenv("CHAT_HISTORY_FILE", "chat_history.json")
+
+# main.py and the server switch sessions at runtime by setting CHAT_HISTORY_FILE
+# in the environment, so per-session paths are resolved on every use.
+def chat_history_file() -> str:
+    return os.getenv("CHAT_HISTORY_FILE", CHAT_HISTORY_FILE)
+
+def session_folder() -> str:
+    return os.path.dirname(os.path.abspath(chat_history_file()))
+
+def summary_cache_file() -> str:
+    return os.getenv("SUMMARY_CACHE_FILE") or os.path.join(session_folder(), "summary_cache.json")
+
+def turn_log_file() -> str:
+    return os.getenv("TURN_LOG_FILE") or os.path.join(session_folder(), "turn_log.jsonl")
 SESSION_STATE_FILE = os.getenv("SESSION_STATE_FILE", "session_state.json")
 CHROMA_DB_DIR = os.getenv("CHROMA_DB_DIR", "chromadb_storage")
 MAX_TEXT_LENGTH = 20000
 MODEL = "mistral"
 
 LEARNING_MODE = True
+
+# Ollama request scheduling (core/llm.py). Keep LLM_MAX_CONCURRENCY in line with
+# the server's OLLAMA_NUM_PARALLEL; background jobs never take more than
+# LLM_BACKGROUND_SLOTS of those slots.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_BACKGROUND_SLOTS = int(os.getenv("LLM_BACKGROUND_SLOTS", "1"))
+
+# Map-reduce document summaries (core/summarizer.py).
+SUMMARY_PAGES_PER_GROUP = int(os.getenv("SUMMARY_PAGES_PER_GROUP", "4"))
+SUMMARY_GROUP_MAX_CHARS = int(os.getenv("SUMMARY_GROUP_MAX_CHARS", "8000"))
+SUMMARY_REDUCE_FANIN = int(os.getenv("SUMMARY_REDUCE_FANIN", "6"))
+# Partial summaries are cached per session in summary_cache_file().
+
+# News scraping (core/web_search.py). Pages are fetched concurrently over one
+# pooled HTTP session, at most WEB_FETCH_PER_HOST at a time per site; whatever
+# is not fetched within WEB_FETCH_DEADLINE seconds (or summarized within
+# WEB_SUMMARY_DEADLINE seconds) is dropped from the answer.
+WEB_FETCH_WORKERS = int(os.getenv("WEB_FETCH_WORKERS", "8"))
+WEB_FETCH_PER_HOST = int(os.getenv("WEB_FETCH_PER_HOST", "2"))
+WEB_FETCH_TIMEOUT = float(os.getenv("WEB_FETCH_TIMEOUT", "8"))
+WEB_FETCH_DEADLINE = float(os.getenv("WEB_FETCH_DEADLINE", "12"))
+WEB_SUMMARY_DEADLINE = float(os.getenv("WEB_SUMMARY_DEADLINE", "45"))
+
+# Persistent web cache (core/web_cache.py), shared by every session. TTLs are
+# in seconds per kind of entry; the file is trimmed, least recently used first,
+# once it grows past WEB_CACHE_MAX_MB.
+WEB_CACHE_FILE = os.getenv(
+    "WEB_CACHE_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database", "web_cache.sqlite3")
+)
+WEB_CACHE_MAX_MB = float(os.getenv("WEB_CACHE_MAX_MB", "64"))
+WEB_CACHE_TTL = {
+    "serp": int(os.getenv("WEB_CACHE_TTL_SERP", str(15 * 60))),
+    "page": int(os.getenv("WEB_CACHE_TTL_PAGE", str(24 * 3600))),
+    "wiki": int(os.getenv("WEB_CACHE_TTL_WIKI", str(7 * 24 * 3600))),
+    "summary": int(os.getenv("WEB_CACHE_TTL_SUMMARY", str(7 * 24 * 3600))),
+}
+
+# Offline Wikipedia (core/offline_wiki.py). Build the index once with
+#   python -m core.offline_wiki build simplewiki-latest-pages-articles.xml.bz2 [--embed]
+# When the index exists, wikipedia_flow answers from it and only calls the
+# online API for queries it cannot answer if WIKI_ONLINE_FALLBACK is set.
+OFFLINE_WIKI_DB = os.getenv(
+    "OFFLINE_WIKI_DB",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database", "offline_wiki.sqlite3")
+)
+WIKI_ONLINE_FALLBACK = os.getenv("WIKI_ONLINE_FALLBACK", "0") == "1"
+
+# Article pre-filter before summarization (core/web_search.py). Pages whose best
+# sentences score below WEB_RELEVANCE_THRESHOLD (cosine, MiniLM) against the
+# query are dropped; the rest are cut down to their most relevant sentences,
+# about WEB_CONDENSE_TOKENS tokens per article.
+WEB_RELEVANCE_THRESHOLD = float(os.getenv("WEB_RELEVANCE_THRESHOLD", "0.3"))
+WEB_CONDENSE_TOKENS = int(os.getenv("WEB_CONDENSE_TOKENS", "600"))
+
+# Episodic conversation memory (core/memory.py): past exchanges recalled per
+# prompt, skipping the most recent messages, and how long the rolling summary
+# that serves as the fallback may grow.
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "3"))
+MEMORY_SKIP_RECENT = int(os.getenv("MEMORY_SKIP_RECENT", "4"))
+MEMORY_MIN_SIMILARITY = float(os.getenv("MEMORY_MIN_SIMILARITY", "0.35"))
+MEMORY_EMBED_REPLY_CHARS = int(os.getenv("MEMORY_EMBED_REPLY_CHARS", "300"))
+MEMORY_SUMMARY_MAX_WORDS = int(os.getenv("MEMORY_SUMMARY_MAX_WORDS", "300"))
+
+# Prompt assembly (core/context.py). CONTEXT_WINDOW is passed to Ollama as
+# num_ctx; prompts are filled to CONTEXT_WINDOW - CONTEXT_RESERVED_OUTPUT tokens
+# counted with tiktoken (or 4 characters per token without it), scaled up by
+# CONTEXT_TOKEN_MARGIN because Llama/Mistral tokenizers split English text into
+# up to ~20% more tokens than tiktoken's cl100k. Set CONTEXT_TOKENIZER to an
+# ungated Hugging Face tokenizer of the served model for exact counts.
+CONTEXT_WINDOW = int(os.getenv("CONTEXT_WINDOW", "4096"))
+CONTEXT_RESERVED_OUTPUT = int(os.getenv("CONTEXT_RESERVED_OUTPUT", "768"))
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "")
+CONTEXT_TOKEN_MARGIN = float(os.getenv("CONTEXT_TOKEN_MARGIN", "1.2"))
+CONTEXT_RECENT_MESSAGES = int(os.getenv("CONTEXT_RECENT_MESSAGES", "8"))
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "3"))
+
+# Prefix (KV-cache) reuse for answers. The recent-history window moves in
+# blocks of CONTEXT_HISTORY_BLOCK messages, so consecutive turns send the same
+# system prompt + history prefix and Ollama only prefills the new tail; the
+# model stays loaded for OLLAMA_KEEP_ALIVE between questions.
+CONTEXT_HISTORY_BLOCK = int(os.getenv("CONTEXT_HISTORY_BLOCK", "8"))
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# Model routing (core/llm.py). Every call names its task and gets the model and
+# Ollama options from this table. User-facing answers and long generations use
+# MODEL; short classifications, plans, titles and memory merges use the smaller
+# SMALL_MODEL (MODEL is used instead if SMALL_MODEL is not pulled). Tasks that
+# share a model also share num_ctx, so Ollama never reloads a model between them.
+SMALL_MODEL = os.getenv("SMALL_MODEL", "qwen2.5:1.5b-instruct")
+SMALL_CONTEXT_WINDOW = int(os.getenv("SMALL_CONTEXT_WINDOW", "4096"))
+# Image descriptions during ingestion need a vision model; there is no fallback.
+IMAGE_MODEL = os.getenv("IMAGE_MODEL", "llava-llama3:latest")
+MODEL_PROFILES = {
+    "answer":    {"model": MODEL, "options": {"num_ctx": CONTEXT_WINDOW}},
+    "summarize": {"model": MODEL, "options": {"num_ctx": CONTEXT_WINDOW, "num_predict": 600, "temperature": 0.3}},
+    "mcq":       {"model": MODEL, "options": {"num_ctx": CONTEXT_WINDOW, "num_predict": 1500, "temperature": 0.7}},
+    "memory":    {"model": SMALL_MODEL, "options": {"num_ctx": SMALL_CONTEXT_WINDOW, "num_predict": 450, "temperature": 0.2}},
+    "plan":      {"model": SMALL_MODEL, "options": {"num_ctx": SMALL_CONTEXT_WINDOW, "num_predict": 96, "temperature": 0}},
+    "classify":  {"model": SMALL_MODEL, "options": {"num_ctx": SMALL_CONTEXT_WINDOW, "num_predict": 8, "temperature": 0}},
+    "validate":  {"model": SMALL_MODEL, "options": {"num_ctx": SMALL_CONTEXT_WINDOW, "num_predict": 4, "temperature": 0}},
+    "title":     {"model": SMALL_MODEL, "options": {"num_ctx": SMALL_CONTEXT_WINDOW, "num_predict": 20, "temperature": 0.2}},
+    "image":     {"model": IMAGE_MODEL, "options": {"num_ctx": CONTEXT_WINDOW}},
+}
+
+# Two-stage retrieval (core/db_utils.py query_chunks). Collections with at least
+# RAG_SECTION_MIN_CHUNKS chunks are searched through their section index first:
+# only chunks on the pages of the RAG_SECTION_TOP_K best sections are ranked.
+# Ingestion (input/input.py) writes that index to the collection named by
+# sections_collection_name().
+SECTIONS_SUFFIX = "__sections"
+
+def sections_collection_name(collection_name: str) -> str:
+    # Chroma collection names are at most 63 characters.
+    return collection_name[:63 - len(SECTIONS_SUFFIX)] + SECTIONS_SUFFIX
+
+RAG_SECTION_TOP_K = int(os.getenv("RAG_SECTION_TOP_K", "4"))
+RAG_SECTION_MIN_CHUNKS = int(os.getenv("RAG_SECTION_MIN_CHUNKS", "300"))
+
+# Cross-encoder rerank (core/rerank.py). Retrieval returns RERANK_CANDIDATES
+# chunks and RERANK_MODEL keeps the best RAG_TOP_K of them, scoring on CPU in
+# batches of RERANK_BATCH for at most RERANK_MAX_MS (checked between batches,
+# so keep batches small). Candidate sets of RERANK_MIN_CANDIDATES or fewer are
+# used as retrieved. Off by default: enabling it downloads RERANK_MODEL once.
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "12"))
+RERANK_MIN_CANDIDATES = int(os.getenv("RERANK_MIN_CANDIDATES", "4"))
+RERANK_BATCH = int(os.getenv("RERANK_BATCH", "4"))
+RERANK_MAX_MS = float(os.getenv("RERANK_MAX_MS", "400"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "5000"))
+
+# Semantic answer cache (core/answer_cache.py). A document question whose
+# MiniLM embedding is at least ANSWER_CACHE_SIMILARITY (cosine) to an earlier,
+# validated one in the same collection gets that answer back, as long as its
+# source chunks are unchanged. Follow-ups that refer back to the conversation
+# (answer_cache.standalone) are always answered fresh, with the conversation.
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92"))
+
+# Per-turn latency budget (core/llm.py turn()). Every LLM request, retrieval and
+# web fetch of a chat turn is cut off when it runs out and the best answer so
+# far is returned; if none exists yet, the plain answer gets
+# TURN_FALLBACK_SECONDS of its own. Turns that missed a stage are logged to
+# turn_log_file().
+TURN_DEADLINE = float(os.getenv("TURN_DEADLINE", "60"))
+TURN_FALLBACK_SECONDS = float(os.getenv("TURN_FALLBACK_SECONDS", "30"))
@@ -0,0 +1,212 @@
+"""
+core/context.py
+
+Token-aware prompt assembly for the answer paths in core/db_utils.py:
+build_context() fills the context window in priority order, and to_messages()
+keeps the stable prefix first so Ollama can reuse its KV cache.
+"""
+
+import math
+import threading
+import core.config as config
+
+# An item is only cut to fit if at least this many of its tokens would remain.
+MIN_PARTIAL_TOKENS = 48
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+class _CharTokenizer:
+    """
+    Estimate used when no real tokenizer is available: 4 characters per token.
+    """
+    margin = None
+
+    def encode(self, text):
+        return list(range((len(text) + 3) // 4))
+
+    def truncate(self, text, n_tokens):
+        return text[:n_tokens * 4]
+
+class _HFTokenizer:
+    # The model's own tokenizer: counts are exact.
+    margin = 1.0
+
+    def __init__(self, name):
+        from transformers import AutoTokenizer
+        self.tok = AutoTokenizer.from_pretrained(name)
+
+    def encode(self, text):
+        return self.tok.encode(text, add_special_tokens=False)
+
+    def truncate(self, text, n_tokens):
+        return self.tok.decode(self.encode(text)[:n_tokens])
+
+class _TiktokenTokenizer:
+    margin = None
+
+    def __init__(self):
+        import tiktoken
+        self.enc = tiktoken.get_encoding("cl100k_base")
+
+    def encode(self, text):
+        return self.enc.encode(text, disallowed_special=())
+
+    def truncate(self, text, n_tokens):
+        return self.enc.decode(self.encode(text)[:n_tokens])
+
+def get_tokenizer():
+    global _tokenizer
+    with _tokenizer_lock:
+        if _tokenizer is None:
+            try:
+                if not config.CONTEXT_TOKENIZER:
+                    raise ValueError("CONTEXT_TOKENIZER not set")
+                _tokenizer = _HFTokenizer(config.CONTEXT_TOKENIZER)
+            except Exception as e:
+                if config.CONTEXT_TOKENIZER:
+                    print(f"[Context] Tokenizer '{config.CONTEXT_TOKENIZER}' unavailable ({e}); trying tiktoken.")
+                try:
+                    _tokenizer = _TiktokenTokenizer()
+                except Exception:
+                    print("[Context] Using a 4-characters-per-token estimate.")
+                    _tokenizer = _CharTokenizer()
+    return _tokenizer
+
+def _margin(tokenizer) -> float:
+    # Estimates are scaled up so the prompt still fits the model's num_ctx.
+    return tokenizer.margin or max(1.0, config.CONTEXT_TOKEN_MARGIN)
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    tokenizer = get_tokenizer()
+    return math.ceil(len(tokenizer.encode(text)) * _margin(tokenizer))
+
+def truncate_tokens(text: str, n_tokens: int) -> str:
+    tokenizer = get_tokenizer()
+    n_tokens = int(n_tokens / _margin(tokenizer))
+    if n_tokens <= 0:
+        return ""
+    return tokenizer.truncate(text, n_tokens)
+
+class Context:
+    """
+    The pieces chosen for one prompt; to_messages() renders them as chat
+    messages.
+    """
+
+    def __init__(self, system, user, documents=None, memory=None, history=None, summary="", tokens=0):
+        self.system = system
+        self.user = user
+        self.documents = documents or []
+        self.memory = memory or []
+        self.history = history or []
+        self.summary = summary
+        self.tokens = tokens
+
+    def background(self) -> str:
+        """
+        Summary, recalled memory and document context as one block of text.
+        """
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of the conversation so far:\n{self.summary}")
+        if self.memory:
+            parts.append("Relevant earlier parts of this conversation:\n" + "\n\n".join(self.memory))
+        if self.documents:
+            joined = "\n\n".join(f"[{i}] {d}" for i, d in enumerate(self.documents, 1))
+            parts.append(f"Use the following context from your documents:\n{joined}")
+        return "\n\n".join(parts)
+
+    def to_messages(self) -> list:
+        messages = [{"role": "system", "content": self.system}]
+        messages.extend({"role": m["role"], "content": m["content"]} for m in self.history)
+        background = self.background()
+        user = f"{background}\n\nQuestion: {self.user}" if background else self.user
+        messages.append({"role": "user", "content": user})
+        return messages
+
+def _take(items: list, budget: int):
+    """
+    Whole items in order while they fit, plus a cut-down copy of the first one
+    that does not (if enough of it fits). Returns (taken, tokens_used).
+    """
+    taken, used = [], 0
+    for item in items:
+        cost = count_tokens(item) + 2
+        if used + cost <= budget:
+            taken.append(item)
+            used += cost
+            continue
+        room = budget - used - 2
+        if room >= MIN_PARTIAL_TOKENS:
+            taken.append(truncate_tokens(item, room) + " …")
+            used = budget
+        break
+    return taken, used
+
+def build_context(user_input: str, system: str, documents=None, memory=None, history=None,
+                  summary: str = "", window: int = None, recall=None) -> Context:
+    """
+    Fills the prompt budget by priority: system + user message, documents (in
+    rank order), memory (in rank order), recent turns (whole blocks of
+    CONTEXT_HISTORY_BLOCK messages, oldest dropped first), then the summary.
+
+    recall(kept) may be given instead of memory: it is called with the number of
+    history messages the prompt keeps and returns memories from before them, so
+    recalled exchanges neither repeat nor skip turns. The summary is then only
+    used when nothing is recalled.
+    """
+    window = window or config.CONTEXT_WINDOW
+    budget = window - config.CONTEXT_RESERVED_OUTPUT
+    # Fixed overhead of the section headers and role labels.
+    budget -= 64
+
+    used = count_tokens(system)
+    user_tokens = count_tokens(user_input)
+    if used + user_tokens > budget:
+        # A pasted wall of text: keep the start of it and leave room for the rest.
+        user_input = truncate_tokens(user_input, max(MIN_PARTIAL_TOKENS, budget // 2 - used))
+        user_tokens = count_tokens(user_input)
+    used += user_tokens
+
+    docs, cost = _take(list(documents or []), budget - used)
+    used += cost
+
+    # The window starts on a block boundary of the (append-only) history and
+    # only ever moves a whole block at a time, so consecutive turns share the
+    # same prompt prefix and Ollama can reuse its KV cache for it.
+    history = list(history or [])
+    block = max(1, config.CONTEXT_HISTORY_BLOCK)
+    first = max(0, len(history) - config.CONTEXT_RECENT_MESSAGES) // block * block
+    costs = {i: count_tokens(history[i]["content"]) + 4 for i in range(first, len(history))}
+
+    def window_start(room):
+        start = first
+        while start < len(history) and sum(costs[i] for i in range(start, len(history))) > room:
+            start = min(start + block, len(history))
+        return start
+
+    if recall is None:
+        mem, mem_cost = _take(list(memory or []), budget - used)
+        start = window_start(budget - used - mem_cost)
+    else:
+        # Memory outranks history, so recalled memories can push history blocks
+        # out; recall again from the new window until the two agree.
+        start = window_start(budget - used)
+        while True:
+            mem, mem_cost = _take(list(recall(len(history) - start) or []), budget - used)
+            new_start = window_start(budget - used - mem_cost)
+            if new_start <= start:
+                break
+            start = new_start
+        if mem:
+            summary = ""
+    used += mem_cost
+    recent = history[start:]
+    used += sum(costs[i] for i in range(start, len(history)))
+
+    summary_taken, cost = _take([summary] if summary else [], budget - used)
+    used += cost
+    return Context(system, user_input, docs, mem, recent, summary_taken[0] if summary_taken else "", used)
@@ -1,10 +1,15 @@
 import os
 import re
 import json
+import threading
 import chromadb
 from sentence_transformers import SentenceTransformer
 from datetime import datetime
-from core.config import CHROMA_DB_DIR, CHAT_HISTORY_FILE, MAX_TEXT_LENGTH, MODEL
+from core.config import (
+    CHROMA_DB_DIR, MEMORY_SUMMARY_MAX_WORDS, chat_history_file,
+    RAG_TOP_K, RAG_SECTION_TOP_K, RAG_SECTION_MIN_CHUNKS, SECTIONS_SUFFIX,
+    sections_collection_name
+)
 
 client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
 query_model = SentenceTransformer("all-MiniLM-L6-v2")
@@ -15,7 +20,14 @@ chat_history = []
 
 # Global long-term memory summary.
 memory_summary = ""
-memory_included = False
+
+# update_memory_summary runs in the background and rewrites memory_summary and
+# the session file while the foreground reads and saves the same state.
+_state_lock = threading.RLock()
+
+SYSTEM_PROMPT = "You are an AI assistant."
+
+_sections = {}
 
 def embed_query(query_text: str):
     return query_model.encode([query_text]).tolist()[0]
@@ -42,22 +54,30 @@ def load_session_state():
     Then, if active_collection_name is found, loads that collection from the DB.
     """
     global chat_history, memory_summary, recent_summary, active_collection, active_collection_name
-    if os.path.exists(CHAT_HISTORY_FILE):
+    history_file = chat_history_file()
+    if os.path.exists(history_file):
         try:
-            with open(CHAT_HISTORY_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            with _state_lock:
+                with open(history_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
                 chat_history[:] = data.get("chat_history", [])
                 memory_summary = data.get("memory_summary", "")
                 recent_summary = data.get("recent_summary", "")
-                saved_coll = data.get("active_collection_name", None)
-                if saved_coll:
-                    load_collection(saved_coll)
+            saved_coll = data.get("active_collection_name", None)
+            if saved_coll:
+                load_collection(saved_coll)
         except Exception as e:
             print(f"[DB] Could not load session state: {e}")
+        # Sessions from before the memory index existed are indexed once here.
+        from core import memory
+        added = memory.index_history(chat_history)
+        if added:
+            print(f"[DB] Indexed {added} earlier exchanges into conversation memory.")
     else:
-        chat_history[:] = []
-        memory_summary = ""
-        recent_summary = ""
+        with _state_lock:
+            chat_history[:] = []
+            memory_summary = ""
+            recent_summary = ""
 
 
 # Add a new global variable for recent summary
@@ -68,25 +88,48 @@ def save_session_state():
     Saves the chat history, memory summary, recent summary, and active_collection_name
     into the same JSON file.
     """
-    data = {
-        "chat_history": chat_history,
-        "memory_summary": memory_summary,
-        "recent_summary": recent_summary,
-        "active_collection_name": active_collection_name
-    }
-    try:
-        with open(CHAT_HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        print(f"[DB] Could not save session state: {e}")
+    with _state_lock:
+        data = {
+            "chat_history": chat_history,
+            "memory_summary": memory_summary,
+            "recent_summary": recent_summary,
+            "active_collection_name": active_collection_name
+        }
+        try:
+            with open(chat_history_file(), "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            print(f"[DB] Could not save session state: {e}")
 
 def set_recent_summary(summary):
     global recent_summary
-    recent_summary = summary
+    with _state_lock:
+        recent_summary = summary
+
 
+def is_auxiliary_collection(name: str) -> bool:
+    """
+    True for collections that index other collections rather than documents.
+    """
+    return name.endswith(SECTIONS_SUFFIX)
+
+def get_sections_collection(collection_name: str):
+    """
+    The section index of a collection, or None if it was ingested without one.
+    """
+    if collection_name not in _sections:
+        try:
+            _sections[collection_name] = client.get_collection(
+                name=sections_collection_name(collection_name)
+            )
+        except Exception:
+            _sections[collection_name] = None
+    return _sections[collection_name]
 
 def load_collection(collection_name: str):
     global active_collection, active_collection_name
+    # A (re-)ingestion may have created the section index since it was last looked up.
+    _sections.pop(collection_name, None)
     try:
         c = client.get_collection(name=collection_name)
         active_collection = c
@@ -95,113 +138,194 @@ def load_collection(collection_name: str):
     except Exception as e:
         print(f"[DB] Error loading collection '{collection_name}': {e}")
 
-def auto_summarize_and_suggest():
+def auto_summarize_and_suggest() -> str:
+    """
+    Summarizes the active collection into the chat and returns the summary text
+    (empty if there is none), which ends with the suggested questions.
+    """
     if not active_collection:
-        return
+        return ""
     try:
-        all_data = active_collection.get(include=["documents"])
-        docs = []
-        for sublist in all_data["documents"]:
-            docs.extend(sublist)
-        combined_text = " ".join(docs)
-        if len(combined_text) > MAX_TEXT_LENGTH:
-            combined_text = combined_text[:MAX_TEXT_LENGTH] + "...(truncated)..."
-        summarization_prompt = (
-            f"You are an AI assistant.\n\n"
-            f"Here is the text from a newly ingested PDF (collection: {active_collection_name}):\n\n"
-            f"{combined_text}\n\n"
-            "1) Summarize this PDF in a few paragraphs.\n"
-            "2) Suggest 3 intelligent questions a user might ask about this PDF.\n\nAssistant:"
-        )
-        import ollama
-        resp = ollama.generate(model=MODEL, prompt=summarization_prompt)
-        summary_text = resp.get("response", "[No summary generated]")
-        summary_text = remove_think_clauses(summary_text)
+        from core.summarizer import summarize_collection
+        summary_text = summarize_collection(active_collection, active_collection_name)
+        if not summary_text:
+            return ""
         print("\n[DB] Auto-Summary + Suggested Questions:\n")
         print(summary_text)
         chat_history.append({"role": "assistant", "content": summary_text})
         save_session_state()
+        return summary_text
     except Exception as e:
         print(f"[DB] Error summarizing new PDF: {e}")
+        return ""
+
+def build_answer_context(user_input: str, documents=None, conversation: bool = True):
+    """
+    Prompt context for an answer: document chunks, recalled memory (or the
+    summary when nothing relevant is recalled) and the recent turns, sized to
+    CONTEXT_WINDOW by core.context. With conversation=False only the documents
+    are used, so the answer does not depend on the chat so far.
+    """
+    from core import context, memory
+    if not conversation:
+        return context.build_context(user_input, SYSTEM_PROMPT, documents=documents)
+    history = chat_history
+    if history and history[-1].get("role") == "user" and history[-1].get("content") == user_input:
+        history = history[:-1]
+    return context.build_context(
+        user_input,
+        SYSTEM_PROMPT,
+        documents=documents,
+        history=history,
+        summary=memory_summary,
+        recall=lambda kept: memory.recall(user_input, history=history, skip_recent=kept)
+    )
+
+def answer_chat(ctx):
+    """
+    Sends the context as chat messages with the same options every time, so
+    Ollama keeps the model loaded and reuses the cached system/history prefix.
+    """
+    from core import llm
+    return llm.chat(ctx.to_messages(), task="answer")
 
 def normal_ollama_chat(user_input: str) -> str:
-    import ollama
-    global memory_included, memory_summary
-    if memory_summary and not memory_included:
-        prompt = (
-            f"You are an AI assistant. Here is your long-term memory from previous conversations:\n{memory_summary}\n\n"
-            f"User: {user_input}\n\nAssistant:"
-        )
-        memory_included = True
-    else:
-        prompt = f"You are an AI assistant.\n\nUser: {user_input}\n\nAssistant:"
+    from core import llm
+    ctx = build_answer_context(user_input)
     try:
-        out = ollama.generate(model=MODEL, prompt=prompt)
-        response_text = out.get("response", "No response")
+        out = answer_chat(ctx)
+        response_text = out["message"]["content"] or "No response"
         response_text = remove_think_clauses(response_text)
         return response_text
+    except llm.DeadlineExceeded:
+        raise
     except Exception as e:
         return f"(Error in normal Ollama chat) {e}"
 
-def rag_ollama_chat(user_input: str) -> str:
+def section_filter(sections: list) -> dict:
     """
-    If there's an active collection, use it for retrieval-augmented generation.
-    Otherwise, fall back to normal chat logic.
+    Chroma where clause for the chunks on the pages of the given sections, plus
+    audio chunks, which have no pages and no sections.
     """
-    if not active_collection:
-        return normal_ollama_chat(user_input)
-    import ollama
+    clauses = [{"type": "audio"}]
+    for meta in sections:
+        clauses.append({"$and": [
+            {"source_file": meta["source_file"]},
+            {"page_number": {"$gte": meta["start_page"]}},
+            {"page_number": {"$lte": meta["end_page"]}}
+        ]})
+    return {"$or": clauses}
+
+def query_chunks(collection, collection_name: str, qembed: list, n_results: int = RAG_TOP_K):
+    """
+    Top chunks for the query embedding. Collections of RAG_SECTION_MIN_CHUNKS or
+    more chunks that have a section index are searched in two stages: the
+    RAG_SECTION_TOP_K closest section summaries first, then only the chunks on
+    those sections' pages.
+    """
+    include = ["documents", "distances", "metadatas"]
+    sections = get_sections_collection(collection_name)
+    if sections is not None and collection.count() >= RAG_SECTION_MIN_CHUNKS:
+        found = sections.query(query_embeddings=[qembed], n_results=RAG_SECTION_TOP_K, include=["metadatas"])
+        metas = found["metadatas"][0] if found.get("metadatas") else []
+        if metas:
+            print("[DB] Searching sections: " + "; ".join(
+                f"{m['source_file']} p.{m['start_page']}-{m['end_page']}" for m in metas))
+            results = collection.query(
+                query_embeddings=[qembed],
+                n_results=n_results,
+                where=section_filter(metas),
+                include=include
+            )
+            if results.get("documents") and len(results["documents"][0]) >= min(n_results, RAG_TOP_K):
+                return results
+            print("[DB] Too few chunks in those sections; searching the whole collection.")
+    return collection.query(query_embeddings=[qembed], n_results=n_results, include=include)
+
+def rag_answer(user_input: str, collection=None, collection_name: str = None) -> dict:
+    """
+    Retrieval-augmented answer from the given (default: active) collection,
+    served from the semantic answer cache when a close enough question was
+    answered before. Standalone questions (answer_cache.cacheable) are answered
+    from the documents alone, so a stored answer never carries one conversation
+    into another; follow-ups keep the conversation in the prompt.
+    Returns {"answer", "cached", "collection", "embedding", "sources"}, where
+    sources holds the (chunk_id, chunk_text) pairs the answer is based on.
+    """
+    from core import llm, answer_cache, rerank
+    if collection is None:
+        collection, collection_name = active_collection, active_collection_name
     qembed = embed_query(user_input)
+    rag = {"answer": "", "cached": False, "collection": collection_name,
+           "embedding": qembed, "sources": []}
+    hit = answer_cache.lookup(collection_name, collection, user_input, qembed)
+    if hit:
+        rag.update(answer=hit["answer"], cached=True)
+        return rag
     try:
-        results = active_collection.query(
-            query_embeddings=[qembed],
-            n_results=1,
-            include=["documents", "distances", "metadatas"]
+        results = llm.run_with_deadline(
+            query_chunks, collection, collection_name, qembed, rerank.candidate_count(),
+            stage="retrieval"
         )
+    except llm.DeadlineExceeded:
+        raise
     except Exception as e:
-        return f"(Error querying active collection) {e}"
+        rag["answer"] = f"(Error querying active collection) {e}"
+        return rag
 
     if not results or not results.get("documents") or not results["documents"][0]:
         fallback = normal_ollama_chat(user_input)
-        return f"I couldn't find relevant info in the vector DB.\n{fallback}"
+        rag["answer"] = f"I couldn't find relevant info in the vector DB.\n{fallback}"
+        return rag
 
-    relevant_data = results["documents"][0][0]
-    prompt = (
-        f"You are an AI assistant. Use the following context from your documents:\n\n"
-        f"{relevant_data}\n\n"
-        f"Now answer the user's question:\nUser: {user_input}\n\nAssistant:"
+    ids, documents = results["ids"][0], results["documents"][0]
+    keep = rerank.rerank(user_input, qembed, documents, RAG_TOP_K)
+    rag["sources"] = [(ids[i], documents[i]) for i in keep]
+    ctx = build_answer_context(
+        user_input,
+        documents=[documents[i] for i in keep],
+        conversation=not answer_cache.cacheable(user_input)
     )
     try:
-        out = ollama.generate(model=MODEL, prompt=prompt)
-        response_text = out.get("response", "No response")
-        response_text = remove_think_clauses(response_text)
-        return response_text
+        out = answer_chat(ctx)
+        response_text = out["message"]["content"] or "No response"
+        rag["answer"] = remove_think_clauses(response_text)
+    except llm.DeadlineExceeded:
+        raise
     except Exception as e:
-        return f"(Error generating RAG answer) {e}"
+        rag["sources"] = []
+        rag["answer"] = f"(Error generating RAG answer) {e}"
+    return rag
 
 # ----- Long-term Memory Functions -----
 def update_memory_summary(new_messages):
     """
-    Appends a detailed summary of the last 10 messages to the existing memory summary.
+    Folds the latest messages into the rolling memory summary. The summary is kept
+    to MEMORY_SUMMARY_MAX_WORDS so this call costs the same however long the session
+    runs; it is only the fallback for the episodic memory in core/memory.py.
     """
     global memory_summary
     new_text = build_chunk_text(new_messages)
+    with _state_lock:
+        current = memory_summary
     prompt = (
         "You are an AI assistant maintaining a long-term memory of a conversation. "
         "You already have an existing conversation summary that covers older details. "
         "Now, here are the last 10 conversation turns that need to be kept detailed:\n\n"
-        f"Existing Conversation Summary:\n{memory_summary if memory_summary else '[None]'}\n\n"
+        f"Existing Conversation Summary:\n{current if current else '[None]'}\n\n"
         f"Last 10 Conversation Turns (detailed):\n{new_text}\n\n"
         "Merge these into an updated conversation summary that retains all key details, "
         "with the older parts compressed and the last 10 turns described in detail. "
+        f"Keep it under {MEMORY_SUMMARY_MAX_WORDS} words. "
         "Output only the updated conversation summary."
     )
-    import ollama
+    from core import llm
     try:
-        resp = ollama.generate(model=MODEL, prompt=prompt)
+        resp = llm.generate(prompt, task="memory")
         updated = resp.get("response", "[No memory update]")
-        memory_summary = updated.strip()
-        save_session_state()
+        with _state_lock:
+            memory_summary = remove_think_clauses(updated).strip()
+            save_session_state()
         print("[DB] Memory summary updated.")
     except Exception as e:
         print(f"[DB] Error updating memory summary: {e}")
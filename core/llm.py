@@ -0,0 +1,314 @@
+"""
+core/llm.py
+
+Single gate for every Ollama request made by this process.
+• At most LLM_MAX_CONCURRENCY requests are in flight at once.
+• Background work (pre-computed summaries, question banks, prefetching) only
+  takes a free slot when no foreground request is waiting, and never more than
+  LLM_BACKGROUND_SLOTS of them.
+• submit() runs a function on the matching thread pool; generate()/chat() calls
+  made inside it inherit its priority.
+• generate()/chat() take a task= name; the model and options come from
+  config.MODEL_PROFILES (see route()).
+• turn() sets a latency budget for one chat turn. It follows the work into
+  submit()ted foreground jobs; requests (and waits for a free slot) are cut off
+  when it runs out and raise DeadlineExceeded, and the stages that missed it
+  are recorded for the turn log.
+"""
+
+import os
+import json
+import time
+import threading
+import contextlib
+import contextvars
+import concurrent.futures
+import ollama
+import core.config as config
+
+FOREGROUND = 0
+BACKGROUND = 1
+
+_priority = contextvars.ContextVar("llm_priority", default=FOREGROUND)
+# {"deadline": monotonic time, "missed": [stage, ...]} of the current turn.
+_turn = contextvars.ContextVar("llm_turn", default=None)
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when the current turn's latency budget runs out.
+    """
+
+class PriorityGate:
+    """
+    Counting semaphore where foreground waiters always go first.
+    """
+
+    def __init__(self, slots: int, background_slots: int):
+        self._cond = threading.Condition()
+        self._free = max(1, slots)
+        self._background_limit = max(1, min(background_slots, self._free))
+        self._background_active = 0
+        self._foreground_waiting = 0
+
+    def acquire(self, priority: int, timeout: float = None) -> bool:
+        """
+        Takes a slot; returns False if none became free within `timeout` seconds.
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if priority == FOREGROUND:
+                self._foreground_waiting += 1
+                try:
+                    while self._free == 0:
+                        if not self._wait(end):
+                            return False
+                finally:
+                    self._foreground_waiting -= 1
+            else:
+                while (self._free == 0 or self._foreground_waiting
+                       or self._background_active >= self._background_limit):
+                    if not self._wait(end):
+                        return False
+                self._background_active += 1
+            self._free -= 1
+            return True
+
+    def _wait(self, end) -> bool:
+        if end is None:
+            self._cond.wait()
+            return True
+        left = end - time.monotonic()
+        if left <= 0:
+            return False
+        self._cond.wait(left)
+        return True
+
+    def release(self, priority: int) -> None:
+        with self._cond:
+            self._free += 1
+            if priority != FOREGROUND:
+                self._background_active -= 1
+            self._cond.notify_all()
+
+_gate = PriorityGate(config.LLM_MAX_CONCURRENCY, config.LLM_BACKGROUND_SLOTS)
+_foreground_pool = concurrent.futures.ThreadPoolExecutor(
+    max_workers=config.LLM_MAX_CONCURRENCY, thread_name_prefix="llm"
+)
+_background_pool = concurrent.futures.ThreadPoolExecutor(
+    max_workers=config.LLM_BACKGROUND_SLOTS, thread_name_prefix="llm-bg"
+)
+# Ollama requests made under a turn deadline; the gate keeps them within
+# LLM_MAX_CONCURRENCY, so this pool never queues.
+_request_pool = concurrent.futures.ThreadPoolExecutor(
+    max_workers=config.LLM_MAX_CONCURRENCY, thread_name_prefix="llm-request"
+)
+# Blocking non-LLM calls waited on with a deadline (see run_with_deadline).
+_io_pool = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="turn-io")
+
+_installed_models = None
+_installed_lock = threading.Lock()
+_missing_reported = set()
+# After a failed ollama.list() the models are not asked for again until the
+# retry time; the wait doubles with each failure, up to LIST_RETRY_MAX seconds.
+LIST_RETRY_MIN = 5.0
+LIST_RETRY_MAX = 120.0
+_list_retry_at = 0.0
+_list_retry_wait = LIST_RETRY_MIN
+
+def installed_models():
+    """
+    Names of the models pulled on the Ollama host, or None if it cannot be asked
+    (then or within the retry wait after a failed attempt).
+    """
+    global _installed_models, _list_retry_at, _list_retry_wait
+    with _installed_lock:
+        if _installed_models is None:
+            if time.monotonic() < _list_retry_at:
+                return None
+            try:
+                names = set()
+                for m in ollama.list().get("models", []):
+                    name = m.get("name") or m.get("model") or ""
+                    names.add(name)
+                    if name.endswith(":latest"):
+                        names.add(name[:-len(":latest")])
+                _installed_models = names
+            except Exception as e:
+                print(f"[LLM] Could not list Ollama models ({e}); retrying in {_list_retry_wait:.0f}s.")
+                _list_retry_at = time.monotonic() + _list_retry_wait
+                _list_retry_wait = min(_list_retry_wait * 2, LIST_RETRY_MAX)
+                return None
+    return _installed_models
+
+def model_for(task: str = None) -> str:
+    """
+    The model that serves a task: its profile's model if it is installed,
+    otherwise config.MODEL.
+    """
+    profile = config.MODEL_PROFILES.get(task or "answer", config.MODEL_PROFILES["answer"])
+    model = profile["model"]
+    installed = installed_models()
+    if model != config.MODEL and installed is not None and model not in installed:
+        if model not in _missing_reported:
+            _missing_reported.add(model)
+            print(f"[LLM] Model '{model}' is not installed; using '{config.MODEL}' instead.")
+        return config.MODEL
+    return model
+
+def route(task: str = None, model: str = None, kwargs: dict = None):
+    """
+    Model and request arguments for a task. An explicit model wins; options
+    given by the caller override the profile's options key by key.
+    """
+    kwargs = dict(kwargs or {})
+    profile = config.MODEL_PROFILES.get(task or "answer", config.MODEL_PROFILES["answer"])
+    chosen = model or model_for(task)
+    options = {k: v for k, v in profile["options"].items() if k != "num_ctx"}
+    if chosen == profile["model"] and "num_ctx" in profile["options"]:
+        options["num_ctx"] = profile["options"]["num_ctx"]
+    elif chosen == config.MODEL:
+        # Same context size as MODEL's own tasks, so Ollama does not reload it.
+        options["num_ctx"] = config.CONTEXT_WINDOW
+    options.update(kwargs.pop("options", None) or {})
+    kwargs["options"] = options
+    kwargs.setdefault("keep_alive", config.OLLAMA_KEEP_ALIVE)
+    return chosen, kwargs
+
+@contextlib.contextmanager
+def turn(budget: float = None, label: str = ""):
+    """
+    Runs the enclosed block under a latency budget of `budget` seconds
+    (default config.TURN_DEADLINE). Nested calls keep the outer, earlier deadline.
+    On exit, a turn that missed any stage is appended to config.turn_log_file().
+    """
+    outer = _turn.get()
+    if outer is not None:
+        yield outer
+        return
+    start = time.monotonic()
+    state = {"deadline": start + (budget or config.TURN_DEADLINE), "missed": []}
+    token = _turn.set(state)
+    try:
+        yield state
+    finally:
+        _turn.reset(token)
+        if state["missed"]:
+            _log_turn(label, time.monotonic() - start, state["missed"])
+
+def remaining():
+    """
+    Seconds left in the current turn's budget, or None outside a turn.
+    """
+    state = _turn.get()
+    return None if state is None else state["deadline"] - time.monotonic()
+
+def extend_deadline(seconds: float) -> None:
+    """
+    Gives the current turn at least `seconds` more, e.g. for a last-resort answer.
+    """
+    state = _turn.get()
+    if state is not None:
+        state["deadline"] = max(state["deadline"], time.monotonic() + seconds)
+
+def record_miss(stage: str) -> None:
+    state = _turn.get()
+    if state is not None and stage not in state["missed"]:
+        state["missed"].append(stage)
+    print(f"[LLM] Deadline missed at stage '{stage}'.")
+
+def check_deadline(stage: str) -> float:
+    """
+    Remaining seconds (None outside a turn); raises DeadlineExceeded if none are left.
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        record_miss(stage)
+        raise DeadlineExceeded(stage)
+    return left
+
+def _log_turn(label: str, elapsed: float, missed: list) -> None:
+    entry = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "turn": label[:200],
+        "elapsed": round(elapsed, 2),
+        "missed": missed,
+    }
+    path = config.turn_log_file()
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"[LLM] Could not write turn log: {e}")
+
+def run_with_deadline(fn, *args, stage: str = "call", **kwargs):
+    """
+    Runs a blocking call (e.g. a Chroma query) on a worker thread and waits for
+    it only as long as the turn allows; the call is abandoned, not killed.
+    """
+    left = check_deadline(stage)
+    if left is None:
+        return fn(*args, **kwargs)
+    future = _io_pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    try:
+        return future.result(timeout=left)
+    except concurrent.futures.TimeoutError:
+        record_miss(stage)
+        raise DeadlineExceeded(stage)
+
+def _request(call: str, task: str, **kwargs):
+    stage = task or "answer"
+    priority = _priority.get()
+    left = check_deadline(stage)
+    if not _gate.acquire(priority, timeout=left):
+        record_miss(stage)
+        raise DeadlineExceeded(stage)
+    abandoned = False
+    try:
+        if left is None:
+            return getattr(ollama, call)(**kwargs)
+        future = _request_pool.submit(getattr(ollama, call), **kwargs)
+        try:
+            return future.result(timeout=max(0.1, remaining()))
+        except concurrent.futures.TimeoutError:
+            if future.done():
+                raise
+            # The request is abandoned, not cancelled: it keeps its gate slot
+            # until Ollama finishes it, so the server is never oversubscribed.
+            abandoned = True
+            future.add_done_callback(lambda _: _gate.release(priority))
+            record_miss(stage)
+            raise DeadlineExceeded(stage)
+    finally:
+        if not abandoned:
+            _gate.release(priority)
+
+def generate(prompt: str, model: str = None, task: str = None, **kwargs):
+    """
+    ollama.generate through the gate; returns Ollama's response unchanged.
+    """
+    model, kwargs = route(task, model, kwargs)
+    return _request("generate", task, model=model, prompt=prompt, **kwargs)
+
+def chat(messages: list, model: str = None, task: str = None, **kwargs):
+    """
+    ollama.chat through the gate; returns Ollama's response unchanged.
+    """
+    model, kwargs = route(task, model, kwargs)
+    return _request("chat", task, model=model, messages=messages, **kwargs)
+
+def submit(fn, *args, background: bool = False, **kwargs) -> concurrent.futures.Future:
+    """
+    Runs fn(*args, **kwargs) on the foreground or background pool.
+    """
+    ctx = contextvars.copy_context()
+
+    def run():
+        if background:
+            # Background work is not part of any user's turn.
+            _priority.set(BACKGROUND)
+            _turn.set(None)
+        return fn(*args, **kwargs)
+
+    pool = _background_pool if background else _foreground_pool
+    return pool.submit(ctx.run, run)
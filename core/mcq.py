@@ -0,0 +1,639 @@
+"""
+core/mcq.py
+
+Multiple-choice question generation as an importable service.
+• Used in-process by the chat loop and the Flask server; it reuses their live
+  Chroma client and MiniLM model from core.db_utils.
+• Quizzes come from the precomputed per-collection question bank when it covers
+  the request, and from concurrent JSON-mode generations over retrieved chunk
+  groups otherwise.
+• generate_quiz() returns the quiz as data; writing mcqs.json is optional.
+• tools/MCQ.py is a thin command-line wrapper around this module.
+"""
+
+import os
+import re
+import json
+import random
+import hashlib
+import threading
+import core.config as config
+from core import db_utils, llm
+from core.db_utils import remove_think_clauses
+
+MCQ_TOTAL = int(os.getenv("MCQ_TOTAL", "20"))
+# Questions asked for per request; smaller requests run concurrently.
+MCQ_PER_REQUEST = int(os.getenv("MCQ_PER_REQUEST", "5"))
+MCQ_GROUP_CHARS = int(os.getenv("MCQ_GROUP_CHARS", "4000"))
+# How many chunks the vector index returns for a --topic quiz.
+MCQ_TOPIC_CHUNKS = int(os.getenv("MCQ_TOPIC_CHUNKS", "24"))
+# Questions whose embeddings are closer than this are treated as duplicates.
+MCQ_DEDUP_THRESHOLD = float(os.getenv("MCQ_DEDUP_THRESHOLD", "0.9"))
+# Ask Ollama for JSON output; the free-text parser is only the fallback.
+MCQ_JSON_MODE = os.getenv("MCQ_JSON_MODE", "1") != "0"
+# Follow-up requests for items that fail validation.
+MCQ_JSON_RETRIES = int(os.getenv("MCQ_JSON_RETRIES", "2"))
+# Question bank built in the background after ingestion: questions per passage,
+# and the minimum topic similarity for a banked question to be served.
+MCQ_BANK_PER_GROUP = int(os.getenv("MCQ_BANK_PER_GROUP", "4"))
+MCQ_BANK_MIN_SCORE = float(os.getenv("MCQ_BANK_MIN_SCORE", "0.35"))
+
+def get_embedder():
+    """
+    The process's already-loaded MiniLM model (same one the collections use).
+    """
+    return db_utils.query_model
+
+def _reading_order(meta):
+    meta = meta or {}
+    return (
+        str(meta.get("source_file", "")),
+        meta.get("page_number", 0) or 0,
+        meta.get("start_time", 0) or 0,
+        meta.get("chunk_index", 0) or 0,
+    )
+
+def fetch_chunk_items(collection):
+    """
+    All (metadata, chunk) pairs of the collection in reading order.
+    """
+    try:
+        data = collection.get(include=["documents", "metadatas"])
+    except Exception as e:
+        print(f"[MCQ] Error fetching docs: {e}")
+        return []
+    items = sorted(zip(data["metadatas"], data["documents"]), key=lambda it: _reading_order(it[0]))
+    return [(meta or {}, doc) for meta, doc in items if doc and doc.strip()]
+
+def fetch_chunks(collection):
+    """
+    All chunks of the collection in reading order.
+    """
+    return [doc for _, doc in fetch_chunk_items(collection)]
+
+def retrieve_topic_chunks(collection, topic: str, n_results: int = MCQ_TOPIC_CHUNKS):
+    """
+    The chunks most relevant to the topic according to the vector index,
+    returned in reading order so neighbouring passages stay together.
+    """
+    qembed = get_embedder().encode([topic]).tolist()[0]
+    try:
+        results = collection.query(
+            query_embeddings=[qembed],
+            n_results=max(1, min(n_results, collection.count())),
+            include=["documents", "metadatas"]
+        )
+    except Exception as e:
+        print(f"[MCQ] Error querying collection: {e}")
+        return []
+    items = sorted(zip(results["metadatas"][0], results["documents"][0]), key=lambda it: _reading_order(it[0]))
+    return [doc for _, doc in items if doc and doc.strip()]
+
+def build_chunk_groups(chunks, n_groups: int, max_chars: int = MCQ_GROUP_CHARS):
+    """
+    Packs consecutive chunks into groups of up to max_chars. If that yields more
+    than n_groups, evenly spaced groups are kept so the quiz spans the whole text.
+    """
+    groups = []
+    current, size = [], 0
+    for chunk in chunks:
+        if current and size + len(chunk) > max_chars:
+            groups.append(" ".join(current))
+            current, size = [], 0
+        current.append(chunk[:max_chars])
+        size += len(current[-1])
+    if current:
+        groups.append(" ".join(current))
+    if len(groups) > n_groups:
+        step = len(groups) / n_groups
+        groups = [groups[int(i * step)] for i in range(n_groups)]
+    return groups
+
+def generate_raw_mcqs(text: str, count: int = MCQ_TOTAL, topic: str = None) -> str:
+    if len(text) < 50:
+        return "Not enough text to generate MCQs."
+    if len(text) > 8000:
+        text = text[:8000] + "...(truncated)..."
+
+    focus = f"Focus the questions on: {topic}.\n" if topic else ""
+    prompt = (
+        "You are an AI specialized in generating multiple-choice questions.\n\n"
+        "Here is some text from a document:\n\n"
+        f"{text}\n\n"
+        f"{focus}"
+        f"Please create {count} MCQs from this content. For each question:\n"
+        "1) Write the question prefixed with a number, e.g. '1. What is...'\n"
+        "2) Provide exactly 4 answer options labeled A), B), C), D)\n"
+        "3) Indicate the correct answer using 'Answer: X' (where X is A, B, C, or D)\n"
+        "4) Provide a short 'Explanation: ...'\n\n"
+        "Assistant:"
+    )
+    try:
+        resp = llm.generate(prompt, task="mcq")
+        return remove_think_clauses(resp.get("response", "No response"))
+    except Exception as e:
+        return f"(Error) {e}"
+
+def request_json_mcqs(text: str, count: int, topic: str = None, avoid=None) -> list:
+    """
+    One JSON-mode generation. Returns the raw items, or [] if the output is not JSON.
+    """
+    focus = f"Focus the questions on: {topic}.\n" if topic else ""
+    avoid_text = ""
+    if avoid:
+        avoid_text = "Do not repeat any of these questions:\n" + "\n".join(f"- {q}" for q in avoid) + "\n"
+    prompt = (
+        "You are an AI specialized in generating multiple-choice questions.\n\n"
+        "Here is some text from a document:\n\n"
+        f"{text}\n\n"
+        f"{focus}{avoid_text}"
+        f"Create {count} MCQs from this content. Respond with JSON only, in exactly this form:\n"
+        '{"mcqs": [{"question": "...", "options": ["...", "...", "...", "..."], '
+        '"answer": "A", "explanation": "..."}]}\n'
+        "Each question has exactly 4 options without letter prefixes, and 'answer' is the letter "
+        "(A, B, C or D) of the correct option."
+    )
+    try:
+        resp = llm.generate(prompt, task="mcq", format="json")
+        data = json.loads(remove_think_clauses(resp.get("response", "")))
+    except Exception as e:
+        print(f"[MCQ] JSON generation failed: {e}")
+        return []
+    if isinstance(data, dict):
+        data = data.get("mcqs") or data.get("questions") or []
+    return data if isinstance(data, list) else []
+
+def _normalized(text: str) -> str:
+    return " ".join(text.lower().split()).rstrip(" .")
+
+def validate_mcq(item):
+    """
+    Normalizes one JSON item to the {question, options, answer, explanation} shape
+    written to mcqs.json, or returns None if it is unusable.
+    """
+    if not isinstance(item, dict):
+        return None
+    question = str(item.get("question", "")).strip()
+    options = item.get("options")
+    if not question or not isinstance(options, list) or len(options) != 4:
+        return None
+    letters = "ABCD"
+    raw = [str(o).strip() for o in options]
+    # Strip letter prefixes only when all four options carry them in order, so
+    # option text such as "C. elegans" is left alone.
+    prefixes = [re.match(r'^([ABCD])[).:]\s+', o) for o in raw]
+    if all(m and m.group(1) == letters[i] for i, m in enumerate(prefixes)):
+        texts = [o[m.end():].strip() for o, m in zip(raw, prefixes)]
+    else:
+        texts = raw
+    if not all(texts) or len(set(_normalized(t) for t in texts)) != 4:
+        return None
+
+    # The answer as option text first ("A cell wall" is not option A), then as a
+    # letter: alone, or followed by ")", "." or ":".
+    answer = str(item.get("answer", "")).strip()
+    wanted = _normalized(answer)
+    matches = [i for i in range(4) if wanted in (_normalized(texts[i]), _normalized(raw[i]))]
+    if len(matches) == 1:
+        letter = letters[matches[0]]
+    else:
+        m = re.match(r'^([ABCD])(?:[).:]|$)', answer) or re.fullmatch(r'([abcd])', answer)
+        if not m:
+            return None
+        letter = m.group(1).upper()
+
+    return {
+        "question": question,
+        "options": [f"{letters[i]}) {t}" for i, t in enumerate(texts)],
+        "answer": letter,
+        "explanation": str(item.get("explanation", "")).strip()
+    }
+
+def generate_json_mcqs(text: str, count: int, topic: str = None) -> list:
+    """
+    JSON-mode generation with per-item validation. Only the missing or invalid
+    items are requested again, up to MCQ_JSON_RETRIES times.
+    """
+    if len(text) < 50:
+        return []
+    if len(text) > 8000:
+        text = text[:8000] + "...(truncated)..."
+    valid = []
+    for attempt in range(MCQ_JSON_RETRIES + 1):
+        missing = count - len(valid)
+        if missing <= 0:
+            break
+        if attempt:
+            print(f"[MCQ] Regenerating {missing} invalid or missing question(s)...")
+        items = request_json_mcqs(text, missing, topic, avoid=[m["question"] for m in valid])
+        for item in items:
+            mcq = validate_mcq(item)
+            if mcq and len(valid) < count:
+                valid.append(mcq)
+    return valid
+
+def generate_group_mcqs(text: str, count: int, topic: str = None) -> list:
+    """
+    JSON mode first; the legacy free-text prompt and parser if that yields nothing.
+    """
+    if MCQ_JSON_MODE:
+        mcqs = generate_json_mcqs(text, count, topic)
+        if mcqs:
+            return mcqs
+    return parse_mcq_output(generate_raw_mcqs(text, count, topic))
+
+def is_placeholder(mcq) -> bool:
+    # Older banks and quiz files may still hold the former failure placeholder.
+    return mcq.get("question") == "MCQ Generation Failed"
+
+def deduplicate_mcqs(mcqs, threshold: float = MCQ_DEDUP_THRESHOLD):
+    """
+    Drops questions whose embedding is within `threshold` cosine similarity of an
+    earlier question.
+    """
+    if len(mcqs) < 2:
+        return mcqs
+    import numpy as np
+    vecs = np.asarray(get_embedder().encode([m["question"] for m in mcqs]), dtype=np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-12
+    sims = vecs @ vecs.T
+    kept = []
+    for i in range(len(mcqs)):
+        if all(sims[i, j] < threshold for j in kept):
+            kept.append(i)
+    return [mcqs[i] for i in kept]
+
+def generate_mcqs(chunks, total: int = MCQ_TOTAL, topic: str = None):
+    """
+    Spreads the quiz over several smaller concurrent requests, one per chunk
+    group, then merges and de-duplicates the results.
+    """
+    n_groups = max(1, -(-total // MCQ_PER_REQUEST))
+    groups = build_chunk_groups(chunks, n_groups)
+    if not groups:
+        return []
+    per_group = -(-total // len(groups))
+    print(f"[MCQ] Generating {total} MCQs from {len(groups)} passages concurrently...")
+
+    futures = [llm.submit(generate_group_mcqs, g, per_group, topic) for g in groups]
+    mcqs = [m for f in futures for m in f.result() if not is_placeholder(m)]
+    return deduplicate_mcqs(mcqs)[:total]
+
+def parse_mcq_output(raw_text: str):
+    """
+    Parses the legacy free-text MCQ format into the same shape as JSON mode
+    (options "A) ...", answer as the letter). Returns [] if nothing is usable.
+    """
+    lines = raw_text.splitlines()
+    mcqs = []
+    current = {"question": "", "options": [], "answer": "", "explanation": ""}
+    in_options = in_answer = in_explanation = False
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        # Question start
+        m_q = re.match(r'^(\d+)\.\s*(.*)$', line)
+        if m_q:
+            if current["question"]:
+                mcqs.append(current)
+            current = {"question": m_q.group(2).strip(), "options": [], "answer": "", "explanation": ""}
+            in_options, in_answer, in_explanation = True, False, False
+            continue
+
+        # Option lines
+        m_o = re.match(r'^([ABCD])\)\s+(.*)$', line, re.IGNORECASE)
+        if m_o and in_options:
+            current["options"].append(f"{m_o.group(1).upper()}) {m_o.group(2).strip()}")
+            continue
+
+        # Answer line
+        m_a = re.match(r'^answer:\s*(.*)$', line, re.IGNORECASE)
+        if m_a:
+            current["answer"] = m_a.group(1).strip()
+            in_options, in_answer, in_explanation = False, True, False
+            continue
+
+        # Explanation line
+        m_e = re.match(r'^explanation:\s*(.*)$', line, re.IGNORECASE)
+        if m_e:
+            current["explanation"] = m_e.group(1).strip()
+            in_options, in_answer, in_explanation = False, False, True
+            continue
+
+        # Continuation
+        if in_explanation:
+            current["explanation"] += " " + line
+        elif in_options:
+            current["question"] += " " + line
+        elif in_answer:
+            current["answer"] += " " + line
+
+    if current["question"]:
+        mcqs.append(current)
+
+    # validate_mcq turns "B", "B) Paris" or "Paris" alike into the letter "B".
+    final = [validate_mcq(mcq) for mcq in mcqs]
+    return [mcq for mcq in final if mcq]
+
+# ── NEW ── Automatically generate a five-word style title if user doesn’t supply one
+def generate_title(text: str) -> str:
+    sample = text[:500]
+    prompt = (
+        "You are an AI assistant. Based on the following content, generate a creative, concise, and formal title "
+        "for a set of multiple-choice questions (MCQs) in exactly one sentence of about five words. Do not add commentary.\n\n"
+        f"Content:\n{sample}\n\nTitle:"
+    )
+    try:
+        resp = llm.generate(prompt, task="title")
+        title = resp.get("response", "").splitlines()[0].strip().strip('"')
+        return title or "Untitled MCQs"
+    except:
+        return "Untitled MCQs"
+
+# ── Question bank ─────────────────────────────────────────────────────────
+# Serializes bank read-modify-writes between the background builder and top-ups.
+_bank_lock = threading.Lock()
+# Banks whose background build is running; top-ups skip them, since the build
+# would add near-identical questions for the same passages.
+_building = set()
+
+def bank_path(session_folder: str, collection_name: str) -> str:
+    return os.path.join(session_folder, f"mcq_bank_{collection_name}.json")
+
+def load_question_bank(session_folder: str, collection_name: str) -> dict:
+    try:
+        with open(bank_path(session_folder, collection_name), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"collection": collection_name, "title": "", "groups": [], "items": []}
+
+def update_question_bank(session_folder: str, collection_name: str, update) -> dict:
+    """
+    Re-reads the bank, applies update(bank) and writes it back atomically, all
+    under one lock, so the background builder and on-demand top-ups do not
+    overwrite each other.
+    """
+    with _bank_lock:
+        bank = load_question_bank(session_folder, collection_name)
+        update(bank)
+        path = bank_path(session_folder, collection_name)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(bank, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    return bank
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def purge_stale_items(bank: dict, items) -> int:
+    """
+    Drops banked questions whose passage (or, for top-ups, any source chunk) is no
+    longer in the collection, e.g. after re-ingesting a changed file. `items` are
+    the collection's current (metadata, chunk) pairs. Returns how many were dropped.
+    """
+    if not items:
+        # Nothing could be read; better to keep the bank than to empty it.
+        return 0
+    groups = {g["hash"] for g in build_page_groups(items)}
+    chunks = {text_hash(doc) for _, doc in items}
+    def current(m):
+        if m.get("group"):
+            return m["group"] in groups
+        return all(h in chunks for h in m.get("sources") or [])
+    before = len(bank.get("items", []))
+    bank["items"] = [m for m in bank.get("items", []) if current(m)]
+    bank["groups"] = [g for g in bank.get("groups", []) if g in groups]
+    return before - len(bank["items"])
+
+def embed_mcqs(mcqs):
+    if not mcqs:
+        return []
+    texts = [f"{m['question']} {' '.join(m['options'])}" for m in mcqs]
+    vecs = get_embedder().encode(texts, normalize_embeddings=True)
+    return [[round(float(x), 5) for x in v] for v in vecs]
+
+def build_page_groups(items, max_chars: int = MCQ_GROUP_CHARS):
+    """
+    Consecutive chunks of one file packed into passages of up to max_chars,
+    each tagged with its file and page range.
+    """
+    groups = []
+    for meta, doc in items:
+        source = meta.get("source_file", "")
+        page = meta.get("page_number")
+        last = groups[-1] if groups else None
+        if not last or last["source_file"] != source or len(last["text"]) + len(doc) > max_chars:
+            last = {"source_file": source, "pages": [page, page], "text": ""}
+            groups.append(last)
+        last["text"] = (last["text"] + " " + doc[:max_chars]).strip()
+        if page is not None:
+            last["pages"] = [last["pages"][0] if last["pages"][0] is not None else page, page]
+    for g in groups:
+        g["hash"] = hashlib.sha1(g["text"].encode("utf-8")).hexdigest()
+    return groups
+
+def build_question_bank(collection, collection_name: str, session_folder: str,
+                        per_group: int = MCQ_BANK_PER_GROUP) -> None:
+    """
+    Generates a few questions for every passage of the collection and stores them,
+    with their pages and embeddings, in the session's bank. Passages already in the
+    bank are skipped, so re-running after re-ingestion only covers new text.
+    Meant to run at background priority (llm.submit(..., background=True)).
+    """
+    key = bank_path(session_folder, collection_name)
+    with _bank_lock:
+        _building.add(key)
+    try:
+        items = fetch_chunk_items(collection)
+        groups = build_page_groups(items)
+        purged = []
+        bank = update_question_bank(session_folder, collection_name,
+                                    lambda b: purged.append(purge_stale_items(b, items)))
+        if purged[0]:
+            print(f"[MCQ] Dropped {purged[0]} banked questions about changed passages.")
+        done = set(bank.get("groups", []))
+        todo = [g for g in groups if g["hash"] not in done]
+        print(f"[MCQ] Building question bank for '{collection_name}': {len(todo)} passages to cover.")
+
+        if not bank.get("title") and groups:
+            title = generate_title(groups[0]["text"])
+            update_question_bank(session_folder, collection_name, lambda b: b.update(title=title))
+
+        for g in todo:
+            mcqs = [m for m in generate_group_mcqs(g["text"], per_group) if not is_placeholder(m)]
+            for m, emb in zip(mcqs, embed_mcqs(mcqs)):
+                m.update(source_file=g["source_file"], pages=g["pages"], group=g["hash"], embedding=emb)
+
+            def add(bank, g=g, mcqs=mcqs):
+                bank.setdefault("items", []).extend(mcqs)
+                bank.setdefault("groups", []).append(g["hash"])
+            update_question_bank(session_folder, collection_name, add)
+        print(f"[MCQ] Question bank for '{collection_name}' is complete.")
+    except Exception as e:
+        print(f"[MCQ] Question bank build failed: {e}")
+    finally:
+        with _bank_lock:
+            _building.discard(key)
+
+def add_to_question_bank(session_folder: str, collection_name: str, mcqs, collection, sources) -> None:
+    """
+    Keeps freshly generated top-up questions for later quizzes, tagged with the
+    hashes of the chunks (`sources`) they were generated from, and drops banked
+    questions whose passages are no longer in the collection. Skipped while the
+    bank is being built.
+    """
+    with _bank_lock:
+        if bank_path(session_folder, collection_name) in _building:
+            print("[MCQ] Question bank build in progress; not banking the top-up questions.")
+            return
+    mcqs = [dict(m) for m in mcqs if not is_placeholder(m)]
+    source_hashes = sorted({text_hash(s) for s in sources})
+    for m, emb in zip(mcqs, embed_mcqs(mcqs)):
+        m.update(source_file=None, pages=None, group=None, sources=source_hashes, embedding=emb)
+    items = fetch_chunk_items(collection)
+
+    def top_up(bank):
+        purge_stale_items(bank, items)
+        bank.setdefault("items", []).extend(mcqs)
+    update_question_bank(session_folder, collection_name, top_up)
+
+def serve_from_bank(bank: dict, topic: str = None, total: int = MCQ_TOTAL):
+    """
+    Picks up to `total` banked questions: the closest ones to the topic, or a
+    random spread over the whole document. Returned without bank bookkeeping.
+    """
+    items = bank.get("items", [])
+    if not items:
+        return []
+    if topic:
+        import numpy as np
+        q = get_embedder().encode([topic], normalize_embeddings=True)[0]
+        scores = np.asarray([m["embedding"] for m in items], dtype=np.float32) @ q
+        order = [i for i in np.argsort(-scores) if scores[i] >= MCQ_BANK_MIN_SCORE]
+        picked = [items[i] for i in order[:total]]
+    else:
+        picked = random.sample(items, min(total, len(items)))
+    keys = ("question", "options", "answer", "explanation")
+    return [{k: m[k] for k in keys} for m in picked]
+
+# ── Service API ───────────────────────────────────────────────────────────
+def parse_mcq_command(command: str):
+    """
+    Parses the chat syntax '(mcq)', '(mcq topic=...)' or '(mcq title=...)'.
+    Returns (topic, title); either may be None.
+    """
+    m = re.match(r'^\(\s*mcq(?:\s+(.*))?\)$', command.strip(), re.IGNORECASE)
+    extra = (m.group(1) or "").strip() if m else ""
+    tm = re.match(r'^topic\s*=\s*(.+)$', extra, re.IGNORECASE)
+    if tm:
+        return tm.group(1).strip(), None
+    tm2 = re.match(r'^title\s*=\s*(.+)$', extra, re.IGNORECASE)
+    if tm2:
+        return None, tm2.group(1).strip().strip('"').strip("'")
+    return None, None
+
+def session_collections():
+    """
+    [(name, collection)] to quiz on by default: the active collection, otherwise
+    every collection in the session's database.
+    """
+    if db_utils.active_collection:
+        return [(db_utils.active_collection_name, db_utils.active_collection)]
+    collections = []
+    for c in db_utils.client.list_collections():
+        name = getattr(c, "name", c)
+        if db_utils.is_auxiliary_collection(name):
+            continue
+        collections.append((name, db_utils.client.get_collection(name=name)))
+    return collections
+
+def save_quiz(quiz: dict, session_folder: str) -> str:
+    """
+    Writes the quiz to mcqs.json in the session folder, or mcqs_<n>.json if taken.
+    """
+    base = os.path.join(session_folder, "mcqs.json")
+    if os.path.exists(base):
+        i = 1
+        while os.path.exists(os.path.join(session_folder, f"mcqs_{i}.json")):
+            i += 1
+        outfile = os.path.join(session_folder, f"mcqs_{i}.json")
+    else:
+        outfile = base
+    with open(outfile, "w", encoding="utf-8") as f:
+        json.dump({"title": quiz["title"], "mcqs": quiz["mcqs"]}, f, indent=2, ensure_ascii=False)
+    return outfile
+
+def generate_quiz(collections=None, topic: str = None, title: str = "", total: int = MCQ_TOTAL,
+                  session_folder: str = None, save: bool = False) -> dict:
+    """
+    Builds a quiz of up to `total` MCQs and returns {"title", "mcqs", "path",
+    "error"}; on failure "mcqs" is empty and "error" says why.
+
+    collections: [(name, collection)], defaulting to session_collections().
+    With a single collection, its question bank is used first and only the
+    shortfall is generated. With save=True the quiz is also written to the
+    session folder and "path" is set.
+    """
+    collections = collections if collections is not None else session_collections()
+    session_folder = session_folder or config.session_folder()
+    bank = None
+    if len(collections) == 1:
+        bank_name = collections[0][0]
+        bank = load_question_bank(session_folder, bank_name)
+
+    def get_chunks():
+        chunks = []
+        for _, c in collections:
+            chunks.extend(retrieve_topic_chunks(c, topic) if topic else fetch_chunks(c))
+        return chunks
+
+    # Serve from the precomputed bank; generate only what it cannot cover
+    mcqs = serve_from_bank(bank, topic, total) if bank else []
+    if mcqs:
+        print(f"[MCQ] Served {len(mcqs)} questions from the question bank.")
+    final_title = title
+    if len(mcqs) < total:
+        chunks = get_chunks()
+        if chunks:
+            final_title = final_title or generate_title(" ".join(chunks)[:500])
+            print(f"[MCQ] Generating MCQs titled '{final_title}'...")
+            fresh = generate_mcqs(chunks, total - len(mcqs), topic)
+            combined = [m for m in deduplicate_mcqs(mcqs + fresh) if not is_placeholder(m)]
+            if bank is not None:
+                fresh_ids = {id(f) for f in fresh}
+                add_to_question_bank(session_folder, bank_name, [m for m in combined if id(m) in fresh_ids],
+                                     collections[0][1], chunks)
+            mcqs = combined[:total]
+            if not mcqs:
+                print("[MCQ] MCQ generation failed.")
+                return {"title": final_title, "mcqs": [], "path": None, "error": "MCQ generation failed"}
+        elif not mcqs:
+            print("[MCQ] No text found to generate MCQs.")
+            return {"title": final_title or "Untitled MCQs", "mcqs": [], "path": None,
+                    "error": "No text found to generate MCQs"}
+    if not final_title:
+        base_title = (bank or {}).get("title") or "Untitled MCQs"
+        final_title = f"{base_title}: {topic}" if topic else base_title
+
+    quiz = {"title": final_title, "mcqs": mcqs, "path": None, "error": None}
+    if save:
+        quiz["path"] = save_quiz(quiz, session_folder)
+        print(f"[MCQ] Saved to {quiz['path']}\n")
+    return quiz
+
+def format_quiz(quiz: dict) -> str:
+    """
+    The quiz as console text, questions with their answers and explanations.
+    """
+    lines = [f"=== MCQs: {quiz['title']} ===", ""]
+    for i, m in enumerate(quiz["mcqs"], 1):
+        lines.append(f"Q{i}. {m['question']}")
+        lines.extend(m["options"])
+        lines.append(f"Answer: {m['answer']}")
+        lines.append(f"Explanation: {m['explanation']}")
+        lines.append("")
+    return "\n".join(lines)
@@ -0,0 +1,105 @@
+"""
+core/memory.py
+
+Episodic memory of a chat session: every finished exchange is embedded into a
+small Chroma index in the session folder, and recall() returns the past
+exchanges most relevant to the current prompt.
+"""
+
+import os
+import threading
+import chromadb
+import core.config as config
+from core import db_utils
+
+COLLECTION_NAME = "episodes"
+
+_client = None
+_collection = None
+_folder = None
+_indexed = set()
+_lock = threading.Lock()
+
+def get_collection():
+    """
+    The session's memory collection, reopened when the session changes.
+    """
+    global _client, _collection, _folder
+    folder = config.session_folder()
+    if _collection is None or folder != _folder:
+        _client = chromadb.PersistentClient(path=os.path.join(folder, "memory_index"))
+        _collection = _client.get_or_create_collection(
+            name=COLLECTION_NAME, metadata={"hnsw:space": "cosine"}
+        )
+        _folder = folder
+        _indexed.clear()
+        _indexed.update(_collection.get(include=[])["ids"])
+    return _collection
+
+def exchanges(history: list):
+    """
+    Yields (turn, user_text, assistant_text) for every user message that is
+    directly followed by an assistant reply; turn is the user message's index.
+    """
+    for i in range(len(history) - 1):
+        if history[i].get("role") == "user" and history[i + 1].get("role") == "assistant":
+            yield i, history[i]["content"], history[i + 1]["content"]
+
+def index_history(history: list) -> int:
+    """
+    Embeds the exchanges of the history that are not in the index yet.
+    Returns how many were added.
+    """
+    with _lock:
+        try:
+            collection = get_collection()
+            new = [(t, u, a) for t, u, a in exchanges(history) if f"turn_{t}" not in _indexed]
+            if not new:
+                return 0
+            documents = [f"USER: {u}\nASSISTANT: {a}" for _, u, a in new]
+            # Later prompts are matched against the question and the start of the reply.
+            embeddings = db_utils.query_model.encode(
+                [f"{u}\n{a[:config.MEMORY_EMBED_REPLY_CHARS]}" for _, u, a in new],
+                normalize_embeddings=True
+            ).tolist()
+            ids = [f"turn_{t}" for t, _, _ in new]
+            collection.add(
+                documents=documents,
+                embeddings=embeddings,
+                metadatas=[{"turn": t} for t, _, _ in new],
+                ids=ids
+            )
+            _indexed.update(ids)
+            return len(new)
+        except Exception as e:
+            print(f"[Memory] Could not index conversation turns: {e}")
+            return 0
+
+def recall(query: str, history: list = None, k: int = None, skip_recent: int = None) -> list:
+    """
+    Up to k past exchanges relevant to the query, oldest first. The last
+    skip_recent messages of the history are never returned.
+    """
+    k = k or config.MEMORY_TOP_K
+    skip_recent = config.MEMORY_SKIP_RECENT if skip_recent is None else skip_recent
+    history = db_utils.chat_history if history is None else history
+    cutoff = len(history) - skip_recent
+    with _lock:
+        try:
+            collection = get_collection()
+            if cutoff <= 0 or not _indexed:
+                return []
+            results = collection.query(
+                query_embeddings=[db_utils.embed_query(query)],
+                n_results=min(k, len(_indexed)),
+                where={"turn": {"$lt": cutoff}},
+                include=["documents", "distances", "metadatas"]
+            )
+        except Exception as e:
+            print(f"[Memory] Recall failed: {e}")
+            return []
+    hits = []
+    for doc, dist, meta in zip(results["documents"][0], results["distances"][0], results["metadatas"][0]):
+        if 1.0 - dist >= config.MEMORY_MIN_SIMILARITY:
+            hits.append((meta.get("turn", 0), doc))
+    return [doc for _, doc in sorted(hits)]
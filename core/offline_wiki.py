@@ -0,0 +1,354 @@
+"""
+core/offline_wiki.py
+
+Offline Wikipedia answers from a local dump, for classrooms without a reliable
+connection.
+• `python -m core.offline_wiki build <pages-articles.xml.bz2>` streams a
+  MediaWiki dump (Simple English fits comfortably) into one SQLite file:
+  a title index (redirects included), the plain-text lead section of every
+  article, and an FTS5 index over those leads.
+• With --embed, every lead is also embedded with all-MiniLM-L6-v2 into a
+  float16 matrix next to the database, which lookups read via np.memmap.
+• lookup() tries an exact title match, then BM25 over the leads; with the
+  matrix, the top BM25 hits are re-scored by embedding similarity, reading only
+  their rows. No network is involved.
+"""
+
+import os
+import re
+import bz2
+import sys
+import sqlite3
+import argparse
+import threading
+import xml.etree.ElementTree as ET
+import numpy as np
+import core.config as config
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+LEAD_MAX_CHARS = 2000
+FTS_CANDIDATES = 20
+# With the embedding matrix, this many BM25 hits are re-scored; only their rows
+# are read from the memmap, never the whole matrix.
+RESCORE_CANDIDATES = 200
+EMBED_BATCH = 256
+
+_local = threading.local()
+_matrix = None
+_matrix_lock = threading.Lock()
+
+def embeddings_path(db_path: str = None) -> str:
+    return (db_path or config.OFFLINE_WIKI_DB) + ".emb"
+
+def available() -> bool:
+    return os.path.exists(config.OFFLINE_WIKI_DB)
+
+def _connect() -> sqlite3.Connection:
+    # SQLite connections are per thread; the index is only ever read here.
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        uri = f"file:{os.path.abspath(config.OFFLINE_WIKI_DB)}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True)
+        _local.conn = conn
+    return conn
+
+def _meta(conn: sqlite3.Connection) -> dict:
+    return dict(conn.execute("SELECT key, value FROM meta").fetchall())
+
+def normalize_title(title: str) -> str:
+    return " ".join(title.replace("_", " ").lower().split())
+
+# ── Wikitext to plain text ────────────────────────────────────────────────
+def _strip_nested(text: str, open_tok: str, close_tok: str) -> str:
+    """
+    Removes balanced open_tok ... close_tok spans (templates, tables), nested or not.
+    """
+    out = []
+    depth = 0
+    i = 0
+    while i < len(text):
+        if text.startswith(open_tok, i):
+            depth += 1
+            i += len(open_tok)
+        elif depth and text.startswith(close_tok, i):
+            depth -= 1
+            i += len(close_tok)
+        else:
+            if not depth:
+                out.append(text[i])
+            i += 1
+    return "".join(out)
+
+def _strip_file_links(text: str) -> str:
+    """
+    Drops [[File:...]] / [[Image:...]] links, whose captions may contain links.
+    """
+    out = []
+    i = 0
+    pattern = re.compile(r'\[\[(?:File|Image|Category):', re.IGNORECASE)
+    while True:
+        m = pattern.search(text, i)
+        if not m:
+            out.append(text[i:])
+            return "".join(out)
+        out.append(text[i:m.start()])
+        depth, j = 0, m.start()
+        while j < len(text):
+            if text.startswith("[[", j):
+                depth += 1
+                j += 2
+            elif text.startswith("]]", j):
+                depth -= 1
+                j += 2
+                if depth == 0:
+                    break
+            else:
+                j += 1
+        i = j
+
+def wikitext_to_plain(wikitext: str) -> str:
+    text = re.sub(r'<!--.*?-->', '', wikitext, flags=re.DOTALL)
+    text = re.sub(r'<ref[^>/]*/>', '', text)
+    text = re.sub(r'<ref[^>]*>.*?</ref>', '', text, flags=re.DOTALL)
+    text = _strip_nested(text, "{{", "}}")
+    text = _strip_nested(text, "{|", "|}")
+    text = _strip_file_links(text)
+    text = re.sub(r'\[\[(?:[^\]|]*\|)?([^\]]*)\]\]', r'\1', text)
+    text = re.sub(r'\[https?://\S+\s+([^\]]*)\]', r'\1', text)
+    text = re.sub(r'\[https?://\S+\]', '', text)
+    text = re.sub(r"'{2,}", '', text)
+    text = re.sub(r'<[^>]+>', '', text)
+    text = text.replace("&nbsp;", " ").replace("&ndash;", "–").replace("&mdash;", "—")
+    lines = [l.strip() for l in text.splitlines()]
+    lines = [l for l in lines if l and not l.startswith(("*", "#", ":", ";", "|", "!"))]
+    return re.sub(r'\s+', ' ', " ".join(lines)).strip()
+
+def lead_section(wikitext: str) -> str:
+    """
+    The article text before its first '== Heading ==', as plain text.
+    """
+    m = re.search(r'^==[^=].*==\s*$', wikitext, flags=re.MULTILINE)
+    lead = wikitext[:m.start()] if m else wikitext
+    return wikitext_to_plain(lead)[:LEAD_MAX_CHARS]
+
+# ── Dump builder ──────────────────────────────────────────────────────────
+def _iter_pages(dump_path: str):
+    """
+    Yields (title, redirect_target or None, wikitext) for main-namespace pages,
+    plus ("", None, base_url) once when the dump's <siteinfo> is read.
+    """
+    opener = bz2.open if dump_path.endswith(".bz2") else open
+    with opener(dump_path, "rb") as f:
+        title = redirect = text = None
+        ns = None
+        root = None
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                continue
+            tag = elem.tag.rsplit("}", 1)[-1]
+            if tag == "base":
+                yield "", None, elem.text or ""
+            elif tag == "title":
+                title = elem.text or ""
+            elif tag == "ns":
+                ns = elem.text
+            elif tag == "redirect":
+                redirect = elem.get("title")
+            elif tag == "text":
+                text = elem.text or ""
+            elif tag == "page":
+                if ns == "0" and title:
+                    yield title, redirect, text or ""
+                title = redirect = text = ns = None
+                # Drop the finished page and every earlier sibling, so memory
+                # stays flat however large the dump is.
+                elem.clear()
+                root.clear()
+                continue
+            elif tag == "siteinfo":
+                root.clear()
+                continue
+            elem.clear()
+
+def build_index(dump_path: str, db_path: str = None, embed: bool = False, limit: int = None) -> None:
+    db_path = db_path or config.OFFLINE_WIKI_DB
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    tmp_path = db_path + ".building"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    conn.executescript(
+        "PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;"
+        "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);"
+        "CREATE TABLE pages (id INTEGER PRIMARY KEY, title TEXT NOT NULL, lead TEXT NOT NULL);"
+        "CREATE TABLE titles (norm TEXT PRIMARY KEY, target TEXT NOT NULL) WITHOUT ROWID;"
+        "CREATE VIRTUAL TABLE lead_fts USING fts5("
+        " title, lead, content='pages', content_rowid='id', tokenize='porter unicode61');"
+    )
+
+    base_url = "https://simple.wikipedia.org/wiki/Main_Page"
+    pages = redirects = 0
+    batch = []
+    for title, redirect, text in _iter_pages(dump_path):
+        if not title:
+            base_url = text or base_url
+            continue
+        if redirect:
+            conn.execute("INSERT OR IGNORE INTO titles VALUES (?, ?)", (normalize_title(title), redirect))
+            redirects += 1
+            continue
+        lead = lead_section(text)
+        if len(lead) < 40:
+            continue
+        batch.append((title, lead))
+        if len(batch) >= 1000:
+            pages += _insert_pages(conn, batch)
+            batch = []
+            print(f"[OfflineWiki] {pages} articles indexed...", end="\r")
+        if limit and pages + len(batch) >= limit:
+            break
+    pages += _insert_pages(conn, batch)
+
+    print(f"\n[OfflineWiki] Building full-text index over {pages} leads ({redirects} redirects)...")
+    conn.execute("INSERT INTO lead_fts(lead_fts) VALUES ('rebuild')")
+    conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+        ("base_url", base_url.rsplit("/", 1)[0] + "/"),
+        ("pages", str(pages)),
+    ])
+    conn.commit()
+
+    if embed:
+        _build_embeddings(conn, tmp_path)
+    conn.execute("VACUUM")
+    conn.close()
+    os.replace(tmp_path, db_path)
+    if embed:
+        os.replace(embeddings_path(tmp_path), embeddings_path(db_path))
+    print(f"[OfflineWiki] Index written to {db_path}")
+
+def _insert_pages(conn: sqlite3.Connection, batch: list) -> int:
+    for title, lead in batch:
+        conn.execute("INSERT INTO pages (title, lead) VALUES (?, ?)", (title, lead))
+        conn.execute("INSERT OR REPLACE INTO titles VALUES (?, ?)", (normalize_title(title), title))
+    return len(batch)
+
+def _build_embeddings(conn: sqlite3.Connection, db_path: str) -> None:
+    """
+    Row i of the matrix is the normalized embedding of page id i + 1.
+    """
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(EMBEDDING_MODEL)
+    dim = model.get_sentence_embedding_dimension()
+    count = conn.execute("SELECT COALESCE(MAX(id), 0) FROM pages").fetchone()[0]
+    matrix = np.lib.format.open_memmap(embeddings_path(db_path), mode="w+", dtype=np.float16, shape=(count, dim))
+    print(f"[OfflineWiki] Embedding {count} leads with {EMBEDDING_MODEL}...")
+    cursor = conn.execute("SELECT id, title, lead FROM pages ORDER BY id")
+    while True:
+        rows = cursor.fetchmany(EMBED_BATCH)
+        if not rows:
+            break
+        texts = [f"{title}. {lead}" for _, title, lead in rows]
+        vectors = model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+        for (page_id, _, _), vec in zip(rows, vectors):
+            matrix[page_id - 1] = vec
+        print(f"[OfflineWiki] {rows[-1][0]}/{count} embedded...", end="\r")
+    matrix.flush()
+    del matrix
+    conn.execute("INSERT INTO meta VALUES ('embedding_model', ?)", (EMBEDDING_MODEL,))
+    conn.commit()
+    print()
+
+# ── Lookup ────────────────────────────────────────────────────────────────
+def _embedding_matrix():
+    global _matrix
+    with _matrix_lock:
+        if _matrix is None:
+            path = embeddings_path()
+            _matrix = np.load(path, mmap_mode="r") if os.path.exists(path) else False
+    return _matrix if _matrix is not False else None
+
+def _fts_query(query: str) -> str:
+    terms = re.findall(r'\w+', query.lower())
+    return " OR ".join(f'"{t}"' for t in terms)
+
+def _fetch(conn: sqlite3.Connection, page_ids: list) -> dict:
+    marks = ",".join("?" * len(page_ids))
+    rows = conn.execute(f"SELECT id, title, lead FROM pages WHERE id IN ({marks})", page_ids).fetchall()
+    return {row[0]: row for row in rows}
+
+def _page_url(conn: sqlite3.Connection, title: str) -> str:
+    base = _meta(conn).get("base_url", "https://simple.wikipedia.org/wiki/")
+    return base + title.replace(" ", "_")
+
+def lookup(query: str):
+    """
+    Best matching article for the query as {"title", "lead", "url"}, or None.
+    """
+    if not available():
+        return None
+    try:
+        conn = _connect()
+        target = conn.execute(
+            "SELECT target FROM titles WHERE norm=?", (normalize_title(query),)
+        ).fetchone()
+        if target:
+            row = conn.execute("SELECT id, title, lead FROM pages WHERE title=?", (target[0],)).fetchone()
+            if row:
+                return {"title": row[1], "lead": row[2], "url": _page_url(conn, row[1])}
+
+        match = _fts_query(query)
+        if not match:
+            return None
+        matrix = _embedding_matrix()
+        rescore = matrix is not None and len(matrix) > 0
+        candidates = [r[0] for r in conn.execute(
+            "SELECT rowid FROM lead_fts WHERE lead_fts MATCH ? ORDER BY bm25(lead_fts, 10.0, 1.0) LIMIT ?",
+            (match, RESCORE_CANDIDATES if rescore else FTS_CANDIDATES)
+        ).fetchall()]
+
+        candidates = [pid for pid in candidates if not rescore or 0 < pid <= len(matrix)]
+        if rescore and candidates:
+            from core.db_utils import query_model
+            q = query_model.encode([query], normalize_embeddings=True, convert_to_numpy=True)[0]
+            rows = np.asarray(matrix[np.asarray(sorted(candidates)) - 1], dtype=np.float32)
+            scores = dict(zip(sorted(candidates), rows @ q))
+            candidates.sort(key=lambda pid: -scores[pid])
+        if not candidates:
+            return None
+        rows = _fetch(conn, candidates[:1])
+        row = rows.get(candidates[0])
+        return {"title": row[1], "lead": row[2], "url": _page_url(conn, row[1])} if row else None
+    except sqlite3.Error as e:
+        print(f"[OfflineWiki] Lookup failed: {e}")
+        return None
+
+def first_sentences(text: str, n: int = 5) -> str:
+    sentences = re.split(r'(?<=[.!?])\s+', text)
+    return " ".join(sentences[:n])
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Build the offline Wikipedia index from a dump.")
+    sub = p.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="Index a pages-articles XML dump (.xml or .xml.bz2).")
+    b.add_argument("dump", help="Path to e.g. simplewiki-latest-pages-articles.xml.bz2")
+    b.add_argument("--db", default=None, help="Output SQLite file (default: OFFLINE_WIKI_DB).")
+    b.add_argument("--embed", action="store_true", help="Also build the embedding matrix.")
+    b.add_argument("--limit", type=int, default=None, help="Stop after this many articles.")
+    q = sub.add_parser("query", help="Look up a query in an existing index.")
+    q.add_argument("text")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    if args.command == "build":
+        build_index(args.dump, args.db, embed=args.embed, limit=args.limit)
+    else:
+        result = lookup(args.text)
+        if not result:
+            sys.exit("[OfflineWiki] No match.")
+        print(f"{result['title']} ({result['url']})\n\n{first_sentences(result['lead'])}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+core/rerank.py
+
+Optional cross-encoder rerank of retrieved chunks (RERANK_ENABLED), scored on
+CPU within RERANK_MAX_MS and the turn's remaining budget.
+"""
+
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import core.config as config
+from core import llm
+
+_model = None
+_model_failed = False
+_model_lock = threading.Lock()
+
+_scores = OrderedDict()
+_scores_lock = threading.Lock()
+
+_warming = False
+
+def get_model():
+    """
+    The cross-encoder, loading it if needed; None if it cannot be loaded.
+    Blocks while loading, so only warm_up() calls it.
+    """
+    global _model, _model_failed
+    with _model_lock:
+        if _model is None and not _model_failed:
+            try:
+                from sentence_transformers import CrossEncoder
+                _model = CrossEncoder(config.RERANK_MODEL, device="cpu")
+                print(f"[Rerank] Loaded {config.RERANK_MODEL}.")
+            except Exception as e:
+                print(f"[Rerank] Could not load {config.RERANK_MODEL} ({e}); reranking disabled.")
+                _model_failed = True
+    return _model
+
+def warm_up() -> None:
+    """
+    Starts loading the model on a background thread (once), if reranking is on.
+    """
+    global _warming
+    if not config.RERANK_ENABLED or _warming:
+        return
+    _warming = True
+    threading.Thread(target=get_model, name="rerank-warmup", daemon=True).start()
+
+def candidate_count() -> int:
+    """
+    How many chunks retrieval should return for the rerank to choose from.
+    """
+    if config.RERANK_ENABLED:
+        return max(config.RAG_TOP_K, config.RERANK_CANDIDATES)
+    return config.RAG_TOP_K
+
+def _query_key(query_embedding: list) -> str:
+    rounded = json.dumps([round(float(x), 4) for x in query_embedding])
+    return hashlib.sha1(rounded.encode("utf-8")).hexdigest()
+
+def _chunk_key(query_key: str, document: str) -> str:
+    return query_key + hashlib.sha1(document.encode("utf-8")).hexdigest()
+
+def _cache_get(key: str):
+    with _scores_lock:
+        if key in _scores:
+            _scores.move_to_end(key)
+            return _scores[key]
+    return None
+
+def _cache_put(key: str, score: float) -> None:
+    with _scores_lock:
+        _scores[key] = score
+        _scores.move_to_end(key)
+        while len(_scores) > config.RERANK_CACHE_SIZE:
+            _scores.popitem(last=False)
+
+def rerank(query: str, query_embedding: list, documents: list, top_k: int = None) -> list:
+    """
+    Indices of the top_k documents, best first. Without reranking (disabled,
+    too few candidates or no model) this is the retrieval order.
+    """
+    top_k = top_k or config.RAG_TOP_K
+    order = list(range(len(documents)))
+    if not config.RERANK_ENABLED or len(documents) <= config.RERANK_MIN_CANDIDATES:
+        return order[:top_k]
+    model = _model
+    if model is None:
+        # Still loading (or failed): never wait for the model inside a turn.
+        warm_up()
+        return order[:top_k]
+
+    qkey = _query_key(query_embedding)
+    keys = [_chunk_key(qkey, d) for d in documents]
+    scores = {i: s for i, s in enumerate(_cache_get(k) for k in keys) if s is not None}
+    pending = [i for i in order if i not in scores]
+
+    budget = config.RERANK_MAX_MS / 1000.0
+    left = llm.remaining()
+    if left is not None:
+        budget = min(budget, left)
+    start = time.monotonic()
+    batch_size = max(1, config.RERANK_BATCH)
+    per_pair = 0.0
+    for b in range(0, len(pending), batch_size):
+        batch = pending[b:b + batch_size]
+        if time.monotonic() - start + per_pair * len(batch) >= budget:
+            print(f"[Rerank] Latency cap reached; {len(pending) - b} chunks left in retrieval order.")
+            break
+        predicted = model.predict([(query, documents[i]) for i in batch], show_progress_bar=False)
+        for i, score in zip(batch, predicted):
+            scores[i] = float(score)
+            _cache_put(keys[i], float(score))
+        per_pair = (time.monotonic() - start) / (b + len(batch))
+
+    ranked = sorted(scores, key=lambda i: -scores[i])
+    ranked += [i for i in order if i not in scores]
+    print(f"[Rerank] Scored {len(scores)} of {len(documents)} chunks in {(time.monotonic() - start) * 1000:.0f} ms.")
+    return ranked[:top_k]
@@ -0,0 +1,240 @@
+"""
+core/summarizer.py
+
+Map-reduce summaries of a whole collection.
+• Chunks are grouped by source file and every SUMMARY_PAGES_PER_GROUP pages
+  (audio: the same number of consecutive chunks), so editing one page only
+  changes one group.
+• Groups are summarized in parallel, then merged SUMMARY_REDUCE_FANIN at a time
+  until a single pass can write the final summary and suggested questions.
+• Every partial summary is cached under the hash of its input, so reloading a
+  collection or re-ingesting a changed file only re-runs what changed. Entries
+  no longer used by any collection of the session are evicted after each run.
+• A collection is summarized in one prompt only if its text fits the summarize
+  model's num_ctx (less num_predict) in tokens; otherwise map-reduce is used.
+"""
+
+import re
+import json
+import hashlib
+import threading
+import core.config as config
+from core import llm, context
+from core.db_utils import remove_think_clauses
+
+# Bump when the prompts change so stale partials are not reused.
+PROMPT_VERSION = "1"
+
+# Tokens kept free in a summarize prompt for its instructions.
+PROMPT_OVERHEAD_TOKENS = 200
+
+# {"entries": {key: summary}, "collections": {collection name: [keys it uses]}}
+_cache = None
+_cache_path = None
+_cache_lock = threading.Lock()
+
+def _load_cache() -> dict:
+    """
+    The partial-summary entries (the "entries" part of the cache file), reloaded
+    when the session changes.
+    """
+    global _cache, _cache_path
+    with _cache_lock:
+        path = config.summary_cache_file()
+        if _cache is None or path != _cache_path:
+            _cache_path = path
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    _cache = json.load(f)
+            except (OSError, ValueError):
+                _cache = {}
+            if "entries" not in _cache:
+                # Older files were a flat {key: summary} map.
+                _cache = {"entries": _cache, "collections": {}}
+        return _cache["entries"]
+
+def _evict_unused(collection_name: str, used: set) -> None:
+    """
+    Records the entries this collection's latest summary used, forgets
+    collections that no longer exist, and drops entries nobody uses any more.
+    """
+    from core import db_utils
+    _load_cache()
+    try:
+        existing = {getattr(c, "name", c) for c in db_utils.client.list_collections()}
+    except Exception:
+        existing = None
+    with _cache_lock:
+        owners = _cache["collections"]
+        owners[collection_name] = sorted(used)
+        if existing is not None:
+            for name in [n for n in owners if n not in existing and n != collection_name]:
+                del owners[name]
+        live = {key for keys in owners.values() for key in keys}
+        stale = [key for key in _cache["entries"] if key not in live]
+        for key in stale:
+            del _cache["entries"][key]
+    if stale:
+        print(f"[Summarizer] Evicted {len(stale)} unused cached summaries.")
+
+def _save_cache() -> None:
+    with _cache_lock:
+        try:
+            with open(_cache_path, "w", encoding="utf-8") as f:
+                json.dump(_cache, f, ensure_ascii=False)
+        except Exception as e:
+            print(f"[Summarizer] Could not save summary cache: {e}")
+
+def _hash(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def fetch_ordered_chunks(collection) -> list:
+    """
+    Returns [(metadata, document)] in reading order: file, page, chunk.
+    """
+    data = collection.get(include=["documents", "metadatas"])
+    items = list(zip(data.get("metadatas") or [], data.get("documents") or []))
+    def order(item):
+        meta = item[0] or {}
+        return (
+            str(meta.get("source_file", "")),
+            meta.get("page_number", 0) or 0,
+            meta.get("start_time", 0) or 0,
+            meta.get("chunk_index", 0) or 0,
+        )
+    items.sort(key=order)
+    return [(meta or {}, doc) for meta, doc in items if doc and doc.strip()]
+
+def group_chunks(items: list) -> list:
+    """
+    Splits ordered chunks into groups of a few pages, each at most
+    SUMMARY_GROUP_MAX_CHARS long. Returns [{"label": ..., "texts": [...]}].
+    """
+    per_group = max(1, config.SUMMARY_PAGES_PER_GROUP)
+    groups = []
+    current_key = None
+    for meta, doc in items:
+        source = meta.get("source_file", "document")
+        if "page_number" in meta:
+            bucket = (int(meta["page_number"]) - 1) // per_group
+            first, last = bucket * per_group + 1, (bucket + 1) * per_group
+            label = f"{source}, pages {first}-{last}"
+        else:
+            bucket = int(meta.get("chunk_index", 0)) // per_group
+            label = f"{source}, part {bucket + 1}"
+        key = (source, bucket)
+        size = sum(len(t) for t in groups[-1]["texts"]) if groups else 0
+        if key != current_key or size + len(doc) > config.SUMMARY_GROUP_MAX_CHARS:
+            groups.append({"label": label, "texts": []})
+            current_key = key
+        groups[-1]["texts"].append(doc)
+    return groups
+
+def prompt_budget() -> int:
+    """
+    Tokens of document text a summarize prompt can hold: the model's num_ctx
+    less the tokens reserved for its output and the instructions.
+    """
+    _, kwargs = llm.route("summarize")
+    options = kwargs["options"]
+    num_ctx = options.get("num_ctx", config.CONTEXT_WINDOW)
+    return num_ctx - options.get("num_predict", config.CONTEXT_RESERVED_OUTPUT) - PROMPT_OVERHEAD_TOKENS
+
+def _cached_generate(key: str, prompt: str, used: set = None) -> str:
+    cache = _load_cache()
+    if used is not None:
+        used.add(key)
+    if key in cache:
+        return cache[key]
+    resp = llm.generate(prompt, task="summarize")
+    text = remove_think_clauses(resp.get("response", "")).strip()
+    if text:
+        with _cache_lock:
+            cache[key] = text
+    return text
+
+def summarize_group(texts: list, used: set = None) -> str:
+    excerpt = context.truncate_tokens("\n\n".join(texts), prompt_budget())
+    key = _hash("map", PROMPT_VERSION, llm.model_for("summarize"), *(_hash(t) for t in texts))
+    prompt = (
+        "You are an AI assistant summarizing one part of a longer document.\n\n"
+        f"Excerpt:\n{excerpt}\n\n"
+        "Write a dense summary of this excerpt in one or two paragraphs. Keep definitions, "
+        "key facts, figures and named concepts. Output only the summary.\n\nAssistant:"
+    )
+    return _cached_generate(key, prompt, used)
+
+def merge_summaries(partials: list, used: set = None) -> str:
+    joined = "\n\n".join(partials)
+    key = _hash("reduce", PROMPT_VERSION, llm.model_for("summarize"), joined)
+    prompt = (
+        "You are an AI assistant. The following are summaries of consecutive parts of one document.\n\n"
+        f"{joined}\n\n"
+        "Merge them into a single summary of one or two paragraphs that keeps the most important "
+        "points from every part, in order. Output only the summary.\n\nAssistant:"
+    )
+    return _cached_generate(key, prompt, used)
+
+def _parallel(fn, batches: list, used: set) -> list:
+    futures = [llm.submit(fn, batch, used) for batch in batches]
+    return [f.result() for f in futures]
+
+def summarize_collection(collection, collection_name: str) -> str:
+    """
+    Returns the final summary plus three suggested questions for the collection.
+    """
+    items = fetch_ordered_chunks(collection)
+    if not items:
+        return ""
+
+    combined_text = " ".join(doc for _, doc in items)
+    budget = prompt_budget()
+    used = set()
+    if context.count_tokens(combined_text) <= budget:
+        # Small documents fit in one prompt; no need for a map stage.
+        material = combined_text
+    else:
+        groups = group_chunks(items)
+        print(f"[Summarizer] Summarizing {len(groups)} sections of '{collection_name}'...")
+        partials = _parallel(summarize_group, [g["texts"] for g in groups], used)
+        level = [f"({g['label']}) {p}" for g, p in zip(groups, partials) if p]
+        fanin = max(2, config.SUMMARY_REDUCE_FANIN)
+        while len(level) > 1 and (len(level) > fanin or context.count_tokens("\n\n".join(level)) > budget):
+            batches = [level[i:i + fanin] for i in range(0, len(level), fanin)]
+            level = [s for s in _parallel(merge_summaries, batches, used) if s]
+        material = context.truncate_tokens("\n\n".join(level), budget)
+    _evict_unused(collection_name, used)
+    _save_cache()
+
+    final_prompt = (
+        f"You are an AI assistant.\n\n"
+        f"Here is the text from a newly ingested PDF (collection: {collection_name}):\n\n"
+        f"{material}\n\n"
+        "1) Summarize this PDF in a few paragraphs.\n"
+        "2) Under the heading 'Suggested Questions:', list 3 intelligent questions a user "
+        "might ask about this PDF, numbered, one per line.\n\nAssistant:"
+    )
+    resp = llm.generate(final_prompt, task="summarize")
+    return remove_think_clauses(resp.get("response", "[No summary generated]"))
+
+def parse_suggested_questions(summary_text: str) -> list:
+    """
+    The suggested questions at the end of a collection summary, without their
+    numbering or markdown. Questions run together on one line (even on the
+    heading line) are split at their numbering and after each sentence, and
+    anything that is not a single question is dropped. Falls back to the whole
+    text when the model left out the heading.
+    """
+    match = re.search(r'suggested questions?\W*', summary_text, flags=re.IGNORECASE)
+    tail = summary_text[match.end():] if match else summary_text
+    questions = []
+    for line in tail.replace("**", "").splitlines():
+        for part in re.split(r'(?<=[.!?])\s+|\s+(?=\d+[)]\s)', line):
+            part = re.sub(r'^\s*(?:[-*•]|\d+[.)])\s*', '', part).strip()
+            if part.endswith("?") and part.count("?") == 1 and part not in questions:
+                questions.append(part)
+    return questions[:3]
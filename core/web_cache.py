@@ -0,0 +1,165 @@
+"""
+core/web_cache.py
+
+Persistent SQLite cache of search results, pages, Wikipedia answers and
+summaries, shared by every chat session, with a TTL per kind of entry.
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import core.config as config
+
+# Query parameters that only track where a click came from.
+TRACKING_PARAMS = re.compile(r'^(utm_\w+|fbclid|gclid|mc_cid|mc_eid|ref|ref_src)$', re.IGNORECASE)
+
+_conn = None
+_lock = threading.Lock()
+
+def _connect() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(config.WEB_CACHE_FILE) or ".", exist_ok=True)
+        _conn = sqlite3.connect(config.WEB_CACHE_FILE, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " etag TEXT, last_modified TEXT, stored_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL, size INTEGER NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        _conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (accessed_at)")
+        _conn.commit()
+    return _conn
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+def normalize_url(url: str) -> str:
+    """
+    Lower-cases scheme and host, drops the fragment, default ports, trailing
+    slashes and tracking parameters, and sorts the remaining query parameters.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if parts.port and not ((parts.scheme == "http" and parts.port == 80)
+                           or (parts.scheme == "https" and parts.port == 443)):
+        host = f"{host}:{parts.port}"
+    params = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                    if not TRACKING_PARAMS.match(k))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), host, path, urlencode(params), ""))
+
+def make_key(*parts: str) -> str:
+    """
+    Hash key for entries derived from several inputs (e.g. URL + query + content).
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def lookup(namespace: str, key: str):
+    """
+    Returns {"value", "etag", "last_modified", "fresh"} for the entry, expired or
+    not, or None if there is none.
+    """
+    with _lock:
+        try:
+            conn = _connect()
+            row = conn.execute(
+                "SELECT value, etag, last_modified, stored_at FROM entries WHERE namespace=? AND key=?",
+                (namespace, key)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE entries SET accessed_at=? WHERE namespace=? AND key=?",
+                (time.time(), namespace, key)
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"[WebCache] Lookup failed: {e}")
+            return None
+    value, etag, last_modified, stored_at = row
+    ttl = config.WEB_CACHE_TTL.get(namespace, 0)
+    return {
+        "value": json.loads(value),
+        "etag": etag,
+        "last_modified": last_modified,
+        "fresh": time.time() - stored_at < ttl
+    }
+
+def get(namespace: str, key: str):
+    """
+    The cached value if it is still within its TTL, otherwise None.
+    """
+    entry = lookup(namespace, key)
+    return entry["value"] if entry and entry["fresh"] else None
+
+def put(namespace: str, key: str, value, etag: str = None, last_modified: str = None) -> None:
+    data = json.dumps(value, ensure_ascii=False)
+    now = time.time()
+    with _lock:
+        try:
+            conn = _connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (namespace, key, data, etag, last_modified, now, now, len(data.encode("utf-8")))
+            )
+            _evict(conn)
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"[WebCache] Could not store entry: {e}")
+
+def touch(namespace: str, key: str) -> None:
+    """
+    Marks an entry as fresh again, after the server answered 304 Not Modified.
+    """
+    now = time.time()
+    with _lock:
+        try:
+            conn = _connect()
+            conn.execute(
+                "UPDATE entries SET stored_at=?, accessed_at=? WHERE namespace=? AND key=?",
+                (now, now, namespace, key)
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"[WebCache] Could not refresh entry: {e}")
+
+def revalidation_headers(entry) -> dict:
+    """
+    If-None-Match / If-Modified-Since headers for a stale entry.
+    """
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+def _evict(conn: sqlite3.Connection) -> None:
+    limit = int(config.WEB_CACHE_MAX_MB * 1024 * 1024)
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    if total <= limit:
+        return
+    # Trim to 90% so a full cache does not evict on every insert.
+    target = int(limit * 0.9)
+    removed = 0
+    for namespace, key, size in conn.execute(
+        "SELECT namespace, key, size FROM entries ORDER BY accessed_at"
+    ).fetchall():
+        if total <= target:
+            break
+        conn.execute("DELETE FROM entries WHERE namespace=? AND key=?", (namespace, key))
+        total -= size
+        removed += 1
+    print(f"[WebCache] Evicted {removed} least recently used entries.")
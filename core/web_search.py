@@ -1,75 +1,147 @@
 # core/web_search.py
 
+import re
+import json
+import time
+import threading
+import contextvars
+from collections import OrderedDict
+import concurrent.futures
+from urllib.parse import urlparse, urljoin
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 import trafilatura
+import lxml.html
 from bs4 import BeautifulSoup
 import wikipedia
 from dateutil import parser as date_parser
 from datetime import datetime
-import ollama
 import sys_msgs
 import core.config as config
 from core.db_utils import remove_think_clauses
-from core import db_utils
+from core import db_utils, llm, web_cache, offline_wiki
 
-def extract_publication_date(html: str):
-    soup = BeautifulSoup(html, "html.parser")
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/58.0.3029.110 Safari/537.36"
+)
+
+_session = None
+_session_lock = threading.Lock()
+_host_limits = {}
+_host_limits_lock = threading.Lock()
+_fetch_pool = concurrent.futures.ThreadPoolExecutor(
+    max_workers=config.WEB_FETCH_WORKERS, thread_name_prefix="web-fetch"
+)
+
+def get_session() -> requests.Session:
+    """
+    One keep-alive HTTP session shared by every fetch, so repeated hosts reuse
+    their connections instead of a new TCP/TLS handshake per page.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=config.WEB_FETCH_WORKERS,
+                                  pool_maxsize=config.WEB_FETCH_WORKERS)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session.headers.update({"User-Agent": USER_AGENT})
+    return _session
+
+def _host_limit(url: str) -> threading.Semaphore:
+    host = urlparse(url).netloc.lower()
+    with _host_limits_lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.Semaphore(max(1, config.WEB_FETCH_PER_HOST))
+        return _host_limits[host]
+
+def request_timeout(default: float) -> float:
+    """
+    The default timeout, shortened to what is left of the current chat turn.
+    """
+    left = llm.check_deadline("web")
+    return default if left is None else min(default, left)
+
+def _get(url: str, headers: dict = None, timeout: float = None) -> requests.Response:
+    with _host_limit(url):
+        return get_session().get(url, headers=headers, timeout=request_timeout(timeout or config.WEB_FETCH_TIMEOUT))
+
+# Meta tags that carry an article's publication date, checked in this order.
+DATE_META_XPATH = (
+    '//meta[@property="article:published_time"]/@content'
+    ' | //meta[@name="pubdate" or @name="publish-date" or @name="publish_date"]/@content'
+)
+
+XML_DECLARATION = re.compile(r'^\s*<\?xml[^>]*\?>')
+
+def parse_html(html):
+    """
+    Parses a page once with lxml; the returned tree is what the date, link and
+    text extraction below all work on.
+    """
+    if isinstance(html, str):
+        # lxml rejects str input that carries an XML encoding declaration.
+        html = XML_DECLARATION.sub("", html, count=1)
+    return lxml.html.fromstring(html)
+
+def extract_publication_date(html):
+    """
+    Publication date from the article meta tags or the first <time datetime>.
+    Accepts raw HTML or a tree from parse_html.
+    """
+    tree = parse_html(html) if isinstance(html, (str, bytes)) else html
     def parse_naive(ds: str):
         dt = date_parser.parse(ds)
         return dt.replace(tzinfo=None)
-    for tag in soup.find_all("meta"):
-        if tag.get("property") == "article:published_time":
-            ds = tag.get("content")
-            try:
-                return parse_naive(ds)
-            except Exception:
-                pass
-        if tag.get("name") in ["pubdate", "publish-date", "publish_date"]:
-            ds = tag.get("content")
-            try:
-                return parse_naive(ds)
-            except Exception:
-                pass
-    ttag = soup.find("time", {"datetime": True})
-    if ttag:
-        ds = ttag["datetime"]
+    for ds in tree.xpath(DATE_META_XPATH) + tree.xpath('//time[@datetime][1]/@datetime'):
         try:
             return parse_naive(ds)
         except Exception:
             pass
     return None
 
-def scrape_webpage(url: str):
-    print(f"[Web] Scraping webpage: {url}")
-    try:
-        downloaded = trafilatura.fetch_url(url=url)
-        extracted = trafilatura.extract(downloaded, include_formatting=True, include_links=True)
-        if not extracted:
-            print(f"[Web] No text extracted from {url}.")
-            return None, None
-        return extracted, downloaded
-    except Exception as e:
-        print(f"[Web] Failed to scrape {url}: {e}")
-        return None, None
+def extract_links(tree, base_url: str = None) -> list:
+    """
+    Absolute http(s) links on the page, in order, without duplicates.
+    """
+    links = []
+    for href in tree.xpath('//a/@href'):
+        link = urljoin(base_url, href.strip()) if base_url else href.strip()
+        if link.startswith(("http://", "https://")) and link not in links:
+            links.append(link)
+    return links
+
+def parse_document(html, url: str = None):
+    """
+    Parses the page once and returns {"text", "links", "published"}. The date and
+    links are read before trafilatura runs, because its cleaning edits the tree.
+    """
+    tree = parse_html(html)
+    published = extract_publication_date(tree)
+    links = extract_links(tree, url)
+    text = trafilatura.extract(tree, url=url, include_formatting=True, include_links=True)
+    return {"text": text, "links": links, "published": published}
 
 def duckduckgo_search(query: str):
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) "
-            "Chrome/58.0.3029.110 Safari/537.36"
-        )
-    }
+    cache_key = web_cache.normalize_query(query)
+    cached = web_cache.get("serp", cache_key)
+    if cached is not None:
+        print(f"[Web] Using cached DuckDuckGo results for: '{query}'")
+        return cached
     encoded = requests.utils.quote(query)
     url = f"https://html.duckduckgo.com/html/?q={encoded}"
     print(f"[Web] Performing DuckDuckGo search with query: '{query}'\nURL: {url}")
     try:
-        resp = requests.get(url, headers=headers, timeout=10)
+        resp = get_session().get(url, timeout=request_timeout(10))
         resp.raise_for_status()
     except Exception as e:
         print(f"[Web] DuckDuckGo request failed: {e}")
         return []
-    soup = BeautifulSoup(resp.text, "html.parser")
+    soup = BeautifulSoup(resp.text, "lxml")
     containers = soup.find_all("div", class_="result__body")
     if not containers:
         containers = soup.find_all("div", class_="result")
@@ -93,32 +165,62 @@ def duckduckgo_search(query: str):
             "search_description": snippet
         })
     print(f"[Web] Retrieved {len(results)} results from DuckDuckGo.")
+    if results:
+        web_cache.put("serp", cache_key, results)
     return results
 
+def offline_wikipedia_answer(query: str) -> str:
+    result = offline_wiki.lookup(query)
+    if not result:
+        return ""
+    print(f"[Web] Offline Wikipedia match: {result['title']}")
+    return (
+        f"**Wikipedia Page**: [{result['title']}]({result['url']})\n\n"
+        f"{offline_wiki.first_sentences(result['lead'])}\n\n"
+        f"Reference: This information was retrieved from an offline Wikipedia copy using the query: '{query}'."
+    )
+
 def wikipedia_flow(query: str) -> str:
     print(f"[Web] Using Wikipedia for query: {query}")
+    # The local dump index answers without any network access.
+    if offline_wiki.available():
+        answer = offline_wikipedia_answer(query)
+        if answer or not config.WIKI_ONLINE_FALLBACK:
+            return answer
+        print("[Web] No offline match; falling back to the online Wikipedia API.")
+    cache_key = web_cache.normalize_query(query)
+    cached = web_cache.get("wiki", cache_key)
+    if cached:
+        print("[Web] Using cached Wikipedia answer.")
+        return cached
     try:
-        results = wikipedia.search(query)
+        results = llm.run_with_deadline(wikipedia.search, query, stage="wiki")
         if not results:
             print("[Web] No Wikipedia pages found.")
             return ""
         # Try each result until one yields a valid page.
         for page_title in results:
             try:
-                page = wikipedia.page(page_title)
+                page = llm.run_with_deadline(wikipedia.page, page_title, stage="wiki")
                 page_url = page.url
-                summary_text = wikipedia.summary(page_title, sentences=5)
+                summary_text = llm.run_with_deadline(wikipedia.summary, page_title, sentences=5, stage="wiki")
                 summary_text = remove_think_clauses(summary_text)
-                return (
+                answer = (
                     f"**Wikipedia Page**: [{page_title}]({page_url})\n\n"
                     f"{summary_text}\n\n"
                     f"Reference: This information was retrieved from Wikipedia using the query: '{query}'."
                 )
+                web_cache.put("wiki", cache_key, answer)
+                return answer
+            except llm.DeadlineExceeded:
+                raise
             except Exception as e:
                 print(f"[Web] Error retrieving page for '{page_title}': {e}")
                 continue
         print("[Web] No valid Wikipedia page could be retrieved.")
         return ""
+    except llm.DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"[Web] Error during Wikipedia retrieval: {e}")
         return ""
@@ -135,46 +237,196 @@ def summarize_article_content(content: str, query: str, pub_date_str: str, link:
         f"Article Content:\n{content}\n\n"
         "Provide a concise summary focusing on the most important details relevant to the query."
     )
-    resp = ollama.chat(
-        model=config.MODEL,
-        messages=[
-            {"role": "system", "content": sys_msg},
-            {"role": "user", "content": prompt_text}
-        ]
-    )
+    resp = llm.chat([
+        {"role": "system", "content": sys_msg},
+        {"role": "user", "content": prompt_text}
+    ], task="summarize")
     raw_summary = resp["message"]["content"].strip()
     clean_summary = remove_think_clauses(raw_summary)
     return clean_summary
 
+def fetch_page(url: str):
+    """
+    Returns {"text", "published"} for an article page, from the web cache when
+    fresh. A stale entry is revalidated with its ETag/Last-Modified, so an
+    unchanged page costs one 304 and no re-extraction.
+    """
+    key = web_cache.normalize_url(url)
+    entry = web_cache.lookup("page", key)
+    if entry and entry["fresh"]:
+        print(f"[Web] Cached page: {url}")
+        return entry["value"]
+    print(f"[Web] Scraping webpage: {url}")
+    try:
+        resp = _get(url, headers=web_cache.revalidation_headers(entry))
+        if resp.status_code == 304 and entry:
+            web_cache.touch("page", key)
+            return entry["value"]
+        resp.raise_for_status()
+        if "html" not in resp.headers.get("Content-Type", "text/html"):
+            print(f"[Web] {url} is not an HTML page.")
+            return None
+        document = parse_document(resp.text, url)
+    except Exception as e:
+        print(f"[Web] Failed to scrape {url}: {e}")
+        return None
+    if not document["text"]:
+        print(f"[Web] No text extracted from {url}.")
+        return None
+    pub_date = document["published"]
+    page = {
+        "text": document["text"],
+        "links": document["links"],
+        "published": pub_date.isoformat() if pub_date else None
+    }
+    web_cache.put("page", key, page, etag=resp.headers.get("ETag"),
+                  last_modified=resp.headers.get("Last-Modified"))
+    return page
+
+def scrape_article(result: dict):
+    """
+    Scrapes one search result; returns it with page_text and publication_date,
+    or None if nothing could be extracted.
+    """
+    page = fetch_page(result["link"])
+    if not page:
+        return None
+    result["page_text"] = page["text"]
+    result["publication_date"] = datetime.fromisoformat(page["published"]) if page["published"] else None
+    return result
+
+def _collect(futures: dict, deadline: float, stage: str) -> dict:
+    """
+    Waits for the futures until the deadline and returns {key: result} for the
+    ones that finished in time. Late ones are cancelled (if not started) and dropped.
+    """
+    done, late = concurrent.futures.wait(list(futures), timeout=max(0.0, deadline - time.monotonic()))
+    for f in late:
+        f.cancel()
+    if late:
+        print(f"[Web] Dropped {len(late)} article(s) that missed the {stage} deadline.")
+        llm.record_miss(f"web {stage}")
+    results = {}
+    for f in done:
+        try:
+            results[futures[f]] = f.result()
+        except Exception as e:
+            print(f"[Web] {stage.capitalize()} failed for {futures[f]}: {e}")
+    return results
+
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+|\n+')
+# Relevance of a page is the mean score of its best few sentences.
+RELEVANCE_TOP_SENTENCES = 3
+
+def split_sentences(text: str) -> list:
+    return [s.strip() for s in SENTENCE_SPLIT.split(text) if len(s.split()) >= 4]
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def condense_articles(articles: list, query: str) -> list:
+    """
+    Embeds every sentence of every article in one batch with the MiniLM model,
+    drops articles whose best sentences score below WEB_RELEVANCE_THRESHOLD, and
+    replaces page_text with the top-scoring sentences (in page order) that fit
+    in WEB_CONDENSE_TOKENS. Returns the articles that were kept.
+    """
+    sentences = [split_sentences(a["page_text"]) for a in articles]
+    flat = [s for sents in sentences for s in sents]
+    if not flat:
+        return []
+    vectors = db_utils.query_model.encode([query] + flat, normalize_embeddings=True, convert_to_numpy=True)
+    scores = vectors[1:] @ vectors[0]
+
+    kept = []
+    offset = 0
+    for article, sents in zip(articles, sentences):
+        article_scores = scores[offset:offset + len(sents)]
+        offset += len(sents)
+        if not sents:
+            continue
+        top = np.sort(article_scores)[::-1][:RELEVANCE_TOP_SENTENCES]
+        relevance = float(top.mean())
+        if relevance < config.WEB_RELEVANCE_THRESHOLD:
+            print(f"[Web] Skipping {article['link']} (relevance {relevance:.2f}).")
+            continue
+        budget = config.WEB_CONDENSE_TOKENS
+        chosen = []
+        for i in np.argsort(-article_scores):
+            cost = estimate_tokens(sents[i])
+            if cost > budget:
+                if chosen:
+                    break
+                continue
+            chosen.append(i)
+            budget -= cost
+        article["page_text"] = " ".join(sents[i] for i in sorted(chosen))
+        article["relevance"] = relevance
+        kept.append(article)
+    print(f"[Web] Kept {len(kept)} of {len(articles)} articles after the relevance filter.")
+    return kept
+
+def turn_capped(seconds: float) -> float:
+    """
+    Monotonic deadline `seconds` from now, but no later than the chat turn's.
+    """
+    left = llm.remaining()
+    return time.monotonic() + (seconds if left is None else max(0.0, min(seconds, left)))
+
 def gather_news_articles(query: str) -> str:
     ddg_results = duckduckgo_search(query)
     if not ddg_results:
         print("[Web] No DuckDuckGo results found.")
         return ""
-    scraped = []
-    for r in ddg_results:
-        text, raw_html = scrape_webpage(r["link"])
-        if not text:
-            continue
-        pub_date = extract_publication_date(raw_html)
-        r["page_text"] = text
-        r["publication_date"] = pub_date
-        scraped.append(r)
+
+    # Fetch and extract every result at once; keep what arrives before the deadline.
+    fetch_deadline = turn_capped(config.WEB_FETCH_DEADLINE)
+    fetches = {
+        _fetch_pool.submit(contextvars.copy_context().run, scrape_article, r): r["link"]
+        for r in ddg_results
+    }
+    scraped = [r for r in _collect(fetches, fetch_deadline, "fetch").values() if r]
     if not scraped:
         print("[Web] No articles could be scraped.")
         return ""
+    # Only relevant sentences of relevant pages go to the LLM.
+    scraped = condense_articles(scraped, query)
+    if not scraped:
+        print("[Web] No scraped article was relevant to the query.")
+        return ""
     def sort_key(x):
         return x["publication_date"] if x["publication_date"] else datetime.min
     scraped.sort(key=sort_key, reverse=True)
-    combined_summary = []
-    for idx, article in enumerate(scraped):
+
+    # Summaries run concurrently through the LLM gate.
+    summary_deadline = turn_capped(config.WEB_SUMMARY_DEADLINE)
+    summaries = {}
+    for article in scraped:
         date_str = str(article["publication_date"]) if article["publication_date"] else "N/A"
         content_text = article["page_text"]
-        if len(content_text) > 5000:
-            content_text = content_text[:5000] + "..."
-        summary = summarize_article_content(content_text, query, date_str, article["link"])
+        article["summary_key"] = web_cache.make_key(
+            web_cache.normalize_url(article["link"]), web_cache.normalize_query(query), content_text
+        )
+        cached = web_cache.get("summary", article["summary_key"])
+        if cached:
+            article["summary"] = cached
+            continue
+        future = llm.submit(summarize_article_content, content_text, query, date_str, article["link"])
+        summaries[future] = article["link"]
+    summaries = _collect(summaries, summary_deadline, "summary") if summaries else {}
+    for article in scraped:
+        if summaries.get(article["link"]):
+            article["summary"] = summaries[article["link"]]
+            web_cache.put("summary", article["summary_key"], article["summary"])
+
+    combined_summary = []
+    for article in scraped:
+        summary = article.get("summary")
+        if not summary:
+            continue
+        date_str = str(article["publication_date"]) if article["publication_date"] else "N/A"
         combined_summary.append(
-            f"Article {idx}:\nLink: {article['link']}\nPublication Date: {date_str}\nSummary:\n{summary}\n"
+            f"Article {len(combined_summary)}:\nLink: {article['link']}\nPublication Date: {date_str}\nSummary:\n{summary}\n"
         )
     return "\n".join(combined_summary)
 
@@ -189,13 +441,10 @@ def refine_external_query(current_query: str, previous_query: str) -> str:
         "Generate a concise combined search query that incorporates both contexts and is suitable for a search engine. "
         "Do not include any quotation marks or extra commentary."
     )
-    resp = ollama.chat(
-        model=config.MODEL,
-        messages=[
-            {"role": "system", "content": sys_msgs.web_query_generator_msg},
-            {"role": "user", "content": prompt}
-        ]
-    )
+    resp = llm.chat([
+        {"role": "system", "content": sys_msgs.web_query_generator_msg},
+        {"role": "user", "content": prompt}
+    ], task="plan")
     new_query = resp["message"]["content"].strip()
     new_query = remove_think_clauses(new_query)
     new_query = new_query.replace('"', '').replace("'", "").strip()
@@ -216,55 +465,115 @@ def generate_web_search_query(user_input: str) -> str:
         "Generate a concise search query suitable for a search engine. "
         "Do not include quotation marks or extra commentary."
     )
-    resp = ollama.chat(
-        model=config.MODEL,
-        messages=[
-            {"role": "system", "content": sys_msgs.web_query_generator_msg},
-            {"role": "user", "content": prompt}
-        ]
-    )
+    resp = llm.chat([
+        {"role": "system", "content": sys_msgs.web_query_generator_msg},
+        {"role": "user", "content": prompt}
+    ], task="plan")
     raw_query = resp["message"]["content"].strip()
     raw_query = db_utils.remove_think_clauses(raw_query).replace('"', '').replace("'", "").strip()
 
-    import re
+    final_query = clean_search_query(raw_query, user_input)
+    print(f"[generate_web_search_query] Generated query: '{final_query}'")
+    return final_query
+
+def clean_search_query(raw_query: str, user_input: str) -> str:
+    raw_query = raw_query.replace('"', '').replace("'", "").strip()
     user_mentioned_year = bool(re.search(r"\b\d{4}\b", user_input))
     if not user_mentioned_year:
         # Remove any 4-digit year from the final query if user didn't explicitly mention it
         raw_query = re.sub(r"\b\d{4}\b", "", raw_query)
-
-    final_query = " ".join(raw_query.split())  # normalize spaces
-    print(f"[generate_web_search_query] Generated query: '{final_query}'")
-    return final_query
+    return " ".join(raw_query.split())  # normalize spaces
 
 # Global variable to store the last external query
 last_external_context = ""
 
-def web_search_flow(user_input: str) -> str:
+# Search plans keyed by a hash of the conversation context they were made for.
+PLAN_CACHE_SIZE = 128
+_plan_cache = OrderedDict()
+_plan_cache_lock = threading.Lock()
+
+def plan_search(user_input: str):
+    """
+    One JSON-mode call that decides whether to search, writes the query and picks
+    the source: {"needs_search": bool, "query": str, "source": "news"|"wiki"}.
+    Returns None if the model's output cannot be used, so callers can fall back
+    to the separate agents.
+    """
+    user_msgs = [msg["content"] for msg in db_utils.chat_history if msg["role"] == "user"]
+    if user_msgs and user_msgs[-1] == user_input:
+        user_msgs = user_msgs[:-1]
+    recent_context = " ".join(user_msgs[-2:]).strip()
+    key = web_cache.make_key(recent_context, last_external_context, user_input)
+    with _plan_cache_lock:
+        if key in _plan_cache:
+            _plan_cache.move_to_end(key)
+            print("[plan_search] Using cached plan.")
+            return dict(_plan_cache[key])
+
+    prompt = (
+        f"Conversation context: {recent_context or 'None'}\n"
+        f"Previous external search query: {last_external_context or 'None'}\n"
+        f"Current message: {user_input}"
+    )
+    try:
+        resp = llm.chat([
+            {"role": "system", "content": sys_msgs.search_planner_msg},
+            {"role": "user", "content": prompt}
+        ], task="plan", format="json")
+        data = json.loads(remove_think_clauses(resp["message"]["content"]))
+    except llm.DeadlineExceeded:
+        raise
+    except Exception as e:
+        print(f"[plan_search] Planner failed: {e}")
+        return None
+    if not isinstance(data, dict) or "needs_search" not in data:
+        print(f"[plan_search] Unusable plan: {data}")
+        return None
+
+    needs_search = data["needs_search"]
+    if isinstance(needs_search, str):
+        needs_search = needs_search.strip().lower() == "true"
+    plan = {
+        "needs_search": bool(needs_search),
+        "query": clean_search_query(str(data.get("query") or ""), user_input) or user_input,
+        "source": "wiki" if str(data.get("source", "")).strip().lower() == "wiki" else "news"
+    }
+    print(f"[plan_search] Plan: {plan}")
+    with _plan_cache_lock:
+        _plan_cache[key] = plan
+        while len(_plan_cache) > PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+    return dict(plan)
+
+def default_plan(user_input: str) -> dict:
+    """
+    The plan used when the planner failed: search news for the message as asked,
+    without spending more model calls on the query or the source.
+    """
+    return {"needs_search": True, "query": clean_search_query(user_input, user_input) or user_input,
+            "source": "news"}
+
+def web_search_flow(user_input: str, plan: dict = None) -> str:
     """
-    Main entry point for an external web search. If a previous query is stored,
-    refine it with the current user query; otherwise, generate a fresh query.
-    Then pass this query to the source-deciding agent and subsequently use Wikipedia or DuckDuckGo news search.
+    Main entry point for an external web search. With a plan from plan_search the
+    query and source come from it; otherwise the previous query is refined (or a
+    fresh one generated) and the source-deciding agent picks Wikipedia or news.
     """
     global last_external_context
 
-    if last_external_context:
-        refined_query = refine_external_query(user_input, last_external_context)
-    else:
-        refined_query = generate_web_search_query(user_input)
+    if plan is None:
+        plan = plan_search(user_input)
 
-    print(f"[web_search_flow] Final search query: '{refined_query}'")
+    if plan:
+        refined_query, source = plan["query"], plan["source"]
+    else:
+        if last_external_context:
+            refined_query = refine_external_query(user_input, last_external_context)
+        else:
+            refined_query = generate_web_search_query(user_input)
+        source = decide_source(refined_query)
 
-    resp = ollama.chat(
-        model=config.MODEL,
-        messages=[
-            {"role": "system", "content": sys_msgs.source_decider_msg},
-            {"role": "user", "content": refined_query}
-        ]
-    )
-    raw_source = resp["message"]["content"].strip()
-    raw_source = remove_think_clauses(raw_source)
-    source = raw_source.lower()
-    print(f"[web_search_flow] source-decider agent says: '{source}'")
+    print(f"[web_search_flow] Final search query: '{refined_query}' (source: {source})")
 
     if source == "wiki":
         result = wikipedia_flow(refined_query)
@@ -275,3 +584,14 @@ def web_search_flow(user_input: str) -> str:
         last_external_context = refined_query
 
     return result
+
+def decide_source(query: str) -> str:
+    resp = llm.chat([
+        {"role": "system", "content": sys_msgs.source_decider_msg},
+        {"role": "user", "content": query}
+    ], task="classify")
+    raw_source = resp["message"]["content"].strip()
+    raw_source = remove_think_clauses(raw_source)
+    source = raw_source.lower().strip(" .!'\"")
+    print(f"[web_search_flow] source-decider agent says: '{source}'")
+    return "wiki" if source == "wiki" else "news"
@@ -1,24 +1,182 @@
 import os
+import threading
+import numpy as np
 import whisper
 from pathlib import Path
 
-def process_audio(audio_path):
+from document_processing.main_multi import (
+    setup_output_folder, add_documents_to_chromadb, remove_source_chunks
+)
+
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+# Language code for transcription; empty means detect it per segment.
+WHISPER_LANGUAGE = os.getenv("WHISPER_LANGUAGE", "") or None
+# Number of 30-second segments decoded together in one batch.
+AUDIO_BATCH_SIZE = int(os.getenv("AUDIO_BATCH_SIZE", "8"))
+
+SAMPLE_RATE = whisper.audio.SAMPLE_RATE
+MAX_SEGMENT_SECONDS = whisper.audio.CHUNK_LENGTH
+MIN_SEGMENT_SECONDS = 5.0
+MIN_SILENCE_SECONDS = 0.3
+FRAME_SECONDS = 0.03
+
+_model = None
+_model_lock = threading.Lock()
+# whisper.decode installs kv-cache hooks on the shared model, so batches from
+# concurrently ingested files must not decode at the same time.
+_decode_lock = threading.Lock()
+
+def get_model():
+    """
+    Loads the Whisper model once and keeps it resident for every later file.
+    """
+    global _model
+    with _model_lock:
+        if _model is None:
+            import torch
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            print(f"[Audio] Loading Whisper model '{WHISPER_MODEL}' on {device}...")
+            _model = whisper.load_model(WHISPER_MODEL, device=device)
+    return _model
+
+def split_on_silence(audio, max_seconds=MAX_SEGMENT_SECONDS, min_seconds=MIN_SEGMENT_SECONDS,
+                     min_silence=MIN_SILENCE_SECONDS):
+    """
+    Energy-based VAD: splits the waveform into (start, end) sample ranges of at
+    most max_seconds, cutting in the middle of pauses where possible.
+    Ranges without any voiced frame are dropped.
+    """
+    frame = int(SAMPLE_RATE * FRAME_SECONDS)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return []
+
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+    threshold = max(float(np.percentile(rms, 10)) * 2.0, 1e-3)
+    voiced = rms >= threshold
+
+    # Centres of silent runs that are long enough to be a pause.
+    padded = np.concatenate(([True], voiced, [True]))
+    edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+    run_starts, run_ends = edges[0::2], edges[1::2]
+    long_runs = (run_ends - run_starts) >= int(min_silence / FRAME_SECONDS)
+    cut_points = ((run_starts + run_ends) // 2)[long_runs]
+
+    max_frames = int(max_seconds / FRAME_SECONDS)
+    min_frames = int(min_seconds / FRAME_SECONDS)
+    segments = []
+    start = 0
+    while start < n_frames:
+        limit = start + max_frames
+        if limit >= n_frames:
+            end = n_frames
+        else:
+            candidates = cut_points[(cut_points > start + min_frames) & (cut_points <= limit)]
+            if len(candidates):
+                end = int(candidates[-1])
+            else:
+                # No pause: cut at the quietest frame of the second half.
+                window = rms[start + max_frames // 2:limit]
+                end = start + max_frames // 2 + int(np.argmin(window)) + 1
+        if voiced[start:end].any():
+            segments.append((start * frame, len(audio) if end == n_frames else end * frame))
+        start = end
+    return segments
+
+def transcribe_segments(audio, segments, language=WHISPER_LANGUAGE):
+    """
+    Transcribes the segments with the resident model, AUDIO_BATCH_SIZE at a time.
+    Returns [{"start": s, "end": s, "text": ...}] with times in seconds.
+    """
+    import torch
+    model = get_model()
+    options = whisper.DecodingOptions(
+        language=language,
+        without_timestamps=True,
+        fp16=model.device.type == "cuda"
+    )
+    transcript = []
+    for i in range(0, len(segments), AUDIO_BATCH_SIZE):
+        batch = segments[i:i + AUDIO_BATCH_SIZE]
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(audio[s:e]), model.dims.n_mels)
+            for s, e in batch
+        ]).to(model.device)
+        with _decode_lock:
+            results = whisper.decode(model, mels, options)
+        for (s, e), result in zip(batch, results):
+            text = result.text.strip()
+            # Same no-speech rule whisper.transcribe applies to its windows.
+            if not text or (result.no_speech_prob > 0.6 and result.avg_logprob < -1.0):
+                continue
+            transcript.append({"start": s / SAMPLE_RATE, "end": e / SAMPLE_RATE, "text": text})
+    return transcript
+
+def format_timestamp(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def chunk_transcript(transcript, max_words=200):
+    """
+    Merges consecutive timestamped segments into chunks of about max_words.
     """
-    Transcribes the audio file to text and saves the output in a .txt file in the output folder.
+    chunks = []
+    current = []
+    count = 0
+    for seg in transcript:
+        words = len(seg["text"].split())
+        if current and count + words > max_words:
+            chunks.append(current)
+            current, count = [], 0
+        current.append(seg)
+        count += words
+    if current:
+        chunks.append(current)
+    return [{
+        "start": segs[0]["start"],
+        "end": segs[-1]["end"],
+        "text": " ".join(s["text"] for s in segs)
+    } for segs in chunks]
+
+def add_transcript_to_chromadb(collection, audio_name, chunks):
+    documents, metadatas, ids = [], [], []
+    for i, chunk in enumerate(chunks):
+        start, end = format_timestamp(chunk["start"]), format_timestamp(chunk["end"])
+        documents.append(f"[{start} - {end}] {chunk['text']}")
+        metadatas.append({
+            "source_file": audio_name,
+            "chunk_index": i,
+            "start_time": round(chunk["start"], 2),
+            "end_time": round(chunk["end"], 2),
+            "type": "audio"
+        })
+        ids.append(f"{audio_name}_audio_chunk_{i}")
+    return add_documents_to_chromadb(collection, documents, metadatas, ids)
+
+def process_audio(audio_path, collection=None, source_name=None):
+    """
+    Transcribes the audio file with the resident Whisper model, saves a timestamped
+    transcript in the chat session folder and, if a collection is given, embeds the
+    timestamped chunks into it. Returns the number of chunks added.
     """
-    model = whisper.load_model("base")  # Load a pre-trained Whisper model
     audio_path = str(audio_path)  # Convert Path object to string if needed
+    session_folder = os.getenv("CHROMA_DB_DIR", "database/chat_unknown")
+    audio_name, output_folder = setup_output_folder(audio_path, session_folder, source_name)
 
-    # Transcribe the audio
-    result = model.transcribe(audio_path)
-    transcription = result['text']
+    audio = whisper.load_audio(audio_path)
+    segments = split_on_silence(audio)
+    print(f"[Audio] {audio_name}: {len(audio) / SAMPLE_RATE:.0f}s of audio in {len(segments)} segments.")
+    transcript = transcribe_segments(audio, segments)
 
     # Save the transcription to a text file
-    output_dir = Path("output") / "audio_transcriptions"
-    output_dir.mkdir(parents=True, exist_ok=True)  # Ensure output directory exists
-
-    output_file = output_dir / f"{Path(audio_path).stem}_transcription.txt"
+    output_file = Path(output_folder) / f"{Path(audio_path).stem}_transcription.txt"
     with open(output_file, "w", encoding="utf-8") as f:
-        f.write(transcription)
-
+        for seg in transcript:
+            f.write(f"[{format_timestamp(seg['start'])} - {format_timestamp(seg['end'])}] {seg['text']}\n")
     print(f"Transcription for {audio_path} saved to {output_file}")
+
+    if collection is None:
+        return 0
+    remove_source_chunks(collection, audio_name)
+    return add_transcript_to_chromadb(collection, audio_name, chunk_transcript(transcript))
@@ -1,8 +1,9 @@
 import os
-import subprocess
 from pathlib import Path
 import logging
 
+from .libreoffice_pool import get_pool
+
 logging.basicConfig(filename='conversion.log', level=logging.INFO)
 
 def convert_to_pdf(input_path):
@@ -23,12 +24,12 @@ def convert_to_pdf(input_path):
     return output_path if output_path.exists() else None
 
 def convert_with_libreoffice(input_path, output_dir):
+    """
+    Converts through the process-wide pool of resident LibreOffice workers.
+    """
     try:
-        cmd = [r"C:\Program Files\LibreOffice\program\soffice.exe",
-       '--headless', '--convert-to', 'pdf', '--outdir', str(output_dir), str(input_path)]
-
-        subprocess.run(cmd, check=True)
-    except subprocess.CalledProcessError as e:
+        get_pool().convert(input_path, output_dir)
+    except Exception as e:
         logging.error(f"Conversion failed for {input_path}: {e}")
 
 def convert_image_to_pdf(input_path, output_path):
@@ -0,0 +1,246 @@
+import os
+import time
+import queue
+import atexit
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+
+LIBREOFFICE_PATH = os.getenv("LIBREOFFICE_PATH", "")
+LIBREOFFICE_WORKERS = int(os.getenv("LIBREOFFICE_WORKERS", "2"))
+LIBREOFFICE_TIMEOUT = float(os.getenv("LIBREOFFICE_TIMEOUT", "120"))
+LIBREOFFICE_STARTUP_TIMEOUT = float(os.getenv("LIBREOFFICE_STARTUP_TIMEOUT", "60"))
+
+DEFAULT_BINARIES = [
+    r"C:\Program Files\LibreOffice\program\soffice.exe",
+    "/Applications/LibreOffice.app/Contents/MacOS/soffice",
+]
+
+try:
+    import uno
+    HAS_UNO = True
+except ImportError:
+    HAS_UNO = False
+
+def find_soffice():
+    """
+    LIBREOFFICE_PATH if set, otherwise soffice/libreoffice on PATH, otherwise the
+    platform's default install location.
+    """
+    if LIBREOFFICE_PATH:
+        return LIBREOFFICE_PATH
+    for name in ("soffice", "libreoffice"):
+        found = shutil.which(name)
+        if found:
+            return found
+    for candidate in DEFAULT_BINARIES:
+        if os.path.exists(candidate):
+            return candidate
+    raise FileNotFoundError("LibreOffice not found; set LIBREOFFICE_PATH to the soffice binary.")
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _prop(name, value):
+    prop = uno.createUnoStruct("com.sun.star.beans.PropertyValue")
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+def _pdf_filter(doc):
+    if doc.supportsService("com.sun.star.sheet.SpreadsheetDocument"):
+        return "calc_pdf_Export"
+    if doc.supportsService("com.sun.star.presentation.PresentationDocument"):
+        return "impress_pdf_Export"
+    if doc.supportsService("com.sun.star.drawing.DrawingDocument"):
+        return "draw_pdf_Export"
+    if doc.supportsService("com.sun.star.text.WebDocument"):
+        return "writer_web_pdf_Export"
+    return "writer_pdf_Export"
+
+class OfficeWorker:
+    """
+    One long-lived headless soffice listening on its own local socket, with its
+    own user profile so concurrent workers never share (and lock) a profile.
+
+    Without the `uno` bridge the worker falls back to one `--convert-to` run per
+    file, still with its private profile and the per-job timeout.
+    """
+
+    def __init__(self, index, binary):
+        self.index = index
+        self.binary = binary
+        self.profile_dir = os.path.join(tempfile.gettempdir(), f"ai_pocket_tutor_lo_{os.getpid()}_{index}")
+        self.process = None
+        self.desktop = None
+        self.port = None
+
+    @property
+    def profile_url(self):
+        return Path(self.profile_dir).as_uri()
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        self.port = _free_port()
+        cmd = [
+            self.binary, "--headless", "--invisible", "--nologo", "--nodefault",
+            "--norestore", "--nolockcheck",
+            f"-env:UserInstallation={self.profile_url}",
+            f"--accept=socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext",
+        ]
+        self.process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.desktop = self._connect()
+        print(f"[LibreOffice] Worker {self.index} listening on port {self.port}")
+
+    def _connect(self):
+        local_ctx = uno.getComponentContext()
+        resolver = local_ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_ctx
+        )
+        url = f"uno:socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext"
+        deadline = time.monotonic() + LIBREOFFICE_STARTUP_TIMEOUT
+        while True:
+            try:
+                ctx = resolver.resolve(url)
+                return ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+            except Exception:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"soffice exited with code {self.process.returncode} during startup")
+                if time.monotonic() > deadline:
+                    raise TimeoutError("soffice did not accept connections in time")
+                time.sleep(0.25)
+
+    def stop(self):
+        self.desktop = None
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.kill()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                pass
+        self.process = None
+
+    def restart(self):
+        """
+        Replaces this worker's soffice with a fresh one, e.g. after a timed-out job
+        whose thread may still hold the old instance.
+        """
+        print(f"[LibreOffice] Restarting worker {self.index}...")
+        self.stop()
+        self.start()
+
+    def _convert_uno(self, desktop, input_path, output_path):
+        doc = desktop.loadComponentFromURL(
+            uno.systemPathToFileUrl(str(input_path)), "_blank", 0, (_prop("Hidden", True),)
+        )
+        if doc is None:
+            raise RuntimeError(f"LibreOffice could not open {input_path}")
+        try:
+            doc.storeToURL(
+                uno.systemPathToFileUrl(str(output_path)), (_prop("FilterName", _pdf_filter(doc)),)
+            )
+        finally:
+            doc.close(True)
+
+    def _convert_cli(self, input_path, output_path, timeout):
+        cmd = [
+            self.binary, "--headless", "--norestore", f"-env:UserInstallation={self.profile_url}",
+            "--convert-to", "pdf", "--outdir", str(output_path.parent), str(input_path)
+        ]
+        subprocess.run(cmd, check=True, timeout=timeout, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def convert(self, input_path, output_path, timeout):
+        """
+        Converts input_path to output_path. A job that exceeds `timeout` kills this
+        worker's soffice (it is restarted for the next job) and raises TimeoutError.
+        """
+        input_path, output_path = Path(input_path).resolve(), Path(output_path).resolve()
+        if not HAS_UNO:
+            self._convert_cli(input_path, output_path, timeout)
+            return output_path
+
+        if not self.is_alive():
+            if self.process is not None:
+                self.restart()
+            else:
+                self.start()
+
+        outcome = {}
+        desktop = self.desktop
+        def job():
+            try:
+                self._convert_uno(desktop, input_path, output_path)
+            except Exception as e:
+                outcome["error"] = e
+
+        thread = threading.Thread(target=job, daemon=True)
+        thread.start()
+        thread.join(timeout)
+        if thread.is_alive():
+            # The blocked UNO call fails once its soffice is gone.
+            self.stop()
+            raise TimeoutError(f"Conversion of {input_path} exceeded {timeout:.0f}s")
+        if "error" in outcome:
+            if not self.is_alive():
+                self.stop()
+            raise outcome["error"]
+        return output_path
+
+class LibreOfficePool:
+    """
+    A fixed set of OfficeWorkers handed out one job at a time. Workers start on
+    first use and stay up for the lifetime of the process.
+    """
+
+    def __init__(self, size=LIBREOFFICE_WORKERS, binary=None, timeout=LIBREOFFICE_TIMEOUT):
+        self.binary = binary or find_soffice()
+        self.timeout = timeout
+        self.workers = [OfficeWorker(i, self.binary) for i in range(max(1, size))]
+        self._idle = queue.Queue()
+        for worker in self.workers:
+            self._idle.put(worker)
+        if not HAS_UNO:
+            print("[LibreOffice] Python 'uno' bridge not available; using one soffice run per file.")
+
+    def convert(self, input_path, output_dir, timeout=None):
+        output_path = Path(output_dir) / f"{Path(input_path).stem}.pdf"
+        worker = self._idle.get()
+        try:
+            return worker.convert(input_path, output_path, timeout or self.timeout)
+        except TimeoutError:
+            # The timed-out job's thread may still be talking to this worker's
+            # old soffice; give the next job a fresh one.
+            if HAS_UNO:
+                try:
+                    worker.restart()
+                except Exception as e:
+                    print(f"[LibreOffice] Could not restart worker {worker.index}: {e}")
+                    worker.stop()
+            raise
+        finally:
+            self._idle.put(worker)
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.stop()
+            shutil.rmtree(worker.profile_dir, ignore_errors=True)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = LibreOfficePool()
+            atexit.register(_pool.shutdown)
+    return _pool
@@ -1,21 +1,53 @@
 import os
 import re
+import threading
+import contextlib
 import concurrent.futures
 
 from .table_extraction import extract_tables_with_metadata
-from .text_extraction import extract_text_without_repetitions
+from .text_extraction import extract_text_without_repetitions, extract_headings
 from .pdf_metadata import extract_metadata_and_links, extract_images, extract_audio
+from .native_extraction import extract_pages_with_headings, IMAGE_EXTENSIONS
 import logging
 
 logging.getLogger("chromadb").setLevel(logging.ERROR)
 
-def setup_output_folder(pdf_path, chat_session_folder):
+# Several files may be ingested concurrently into the same collection; the
+# embedder and the Chroma writer are shared, so inserts are serialized.
+_chroma_write_lock = threading.Lock()
+
+# Chunk sizes in tokens of the embedding model (all-MiniLM-L6-v2 reads at most
+# 256). Consecutive chunks share up to CHUNK_OVERLAP_TOKENS of whole sentences; a
+# heading starts a new chunk once the current one has CHUNK_MIN_TOKENS.
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "220"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "60"))
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "sentence-transformers/all-MiniLM-L6-v2")
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+# A page whose text ends with one of these did not break off mid-sentence.
+SENTENCE_CLOSERS = (".", "!", "?", ":", ";", '"', "'", ")", "]", ">", "”")
+
+_chunk_tokenizer = None
+_chunk_tokenizer_lock = threading.Lock()
+
+# Section index for two-stage retrieval (see core/db_utils.query_chunks): one
+# extractive summary per outline entry down to SECTION_TOC_LEVEL, or per page
+# when the PDF has no outline. Sections longer than SECTION_MAX_PAGES are split.
+SECTION_TOC_LEVEL = int(os.getenv("SECTION_TOC_LEVEL", "2"))
+SECTION_MAX_PAGES = int(os.getenv("SECTION_MAX_PAGES", "10"))
+SECTION_SUMMARY_WORDS = int(os.getenv("SECTION_SUMMARY_WORDS", "150"))
+
+def setup_output_folder(pdf_path, chat_session_folder, source_name=None):
     """
     Instead of 'output/<pdf_name>', store the extracted content
     in the chat session folder so each chat has its own separate output.
+    `source_name` (e.g. a path inside an ingested folder) replaces the file's
+    base name as the key of its chunks and output folder.
     """
-    pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
-    output_folder = os.path.join(chat_session_folder, f"{pdf_name}_extracted")
+    pdf_name = source_name or os.path.splitext(os.path.basename(pdf_path))[0]
+    folder_name = re.sub(r'[\\/]+', '__', pdf_name)
+    output_folder = os.path.join(chat_session_folder, f"{folder_name}_extracted")
     os.makedirs(output_folder, exist_ok=True)
     return pdf_name, output_folder
 
@@ -72,57 +104,148 @@ def remove_tables_from_text(page_texts, tables_with_metadata):
     return page_texts
 
 def remove_excess_newlines(page_texts):
+    """
+    Collapses runs of blank lines into one, keeping the paragraph breaks the
+    chunker works from.
+    """
     for page_num, text in page_texts.items():
-        text = re.sub(r'(\n\s*)+', '\n', text)
+        text = re.sub(r'[ \t]+\n', '\n', text)
+        text = re.sub(r'\n{3,}', '\n\n', text)
         page_texts[page_num] = text.strip()
     return page_texts
 
-def chunk_text_semantic(text, max_words=200):
+def get_chunk_tokenizer():
     """
-    Split text into semantically meaningful chunks:
-      1. Split text by double newlines into paragraphs.
-      2. Merge paragraphs up to ~max_words.
-      3. If a paragraph alone is too big, split by sentence boundaries.
+    The embedding model's tokenizer (CHUNK_TOKENIZER), loaded once; None if it
+    cannot be loaded, in which case token counts are estimated from words.
     """
-    paragraphs = re.split(r'\n{2,}', text)
-    chunks = []
-    current_chunk = []
-    current_count = 0
+    global _chunk_tokenizer
+    with _chunk_tokenizer_lock:
+        if _chunk_tokenizer is None:
+            try:
+                from transformers import AutoTokenizer
+                _chunk_tokenizer = AutoTokenizer.from_pretrained(CHUNK_TOKENIZER)
+            except Exception as e:
+                print(f"[Chunk] Tokenizer '{CHUNK_TOKENIZER}' unavailable ({e}); estimating tokens from words.")
+                _chunk_tokenizer = False
+    return _chunk_tokenizer or None
+
+def count_tokens(texts):
+    """
+    Embedding-model token counts for a list of texts, in one batch.
+    """
+    tokenizer = get_chunk_tokenizer()
+    if tokenizer is None:
+        return [int(len(t.split()) * 1.3) + 1 for t in texts]
+    return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
 
-    for para in paragraphs:
-        para = para.strip()
-        if not para:
-            continue
-        word_count = len(para.split())
-        if current_count + word_count <= max_words:
-            current_chunk.append(para)
-            current_count += word_count
+def is_heading(paragraph, page_headings):
+    return paragraph in page_headings
+
+def document_units(page_texts, headings=None):
+    """
+    The document as a flat list of units in reading order: every heading, and
+    every sentence of the other paragraphs. A sentence cut off by a page break is
+    joined with its continuation on the next page. Units are dicts with text,
+    page, end_page, heading and para (True for the first sentence of a paragraph).
+    """
+    headings = headings or {}
+    units = []
+    for page_num in sorted(page_texts):
+        page_headings = {" ".join(h.split()) for h in headings.get(page_num, [])}
+        paragraphs = [" ".join(p.split()) for p in re.split(r'\n\s*\n', page_texts[page_num])]
+        for n, paragraph in enumerate(p for p in paragraphs if p):
+            heading = is_heading(paragraph, page_headings)
+            sentences = [paragraph] if heading else [s for s in SENTENCE_END.split(paragraph) if s]
+            prev = units[-1] if units else None
+            if (n == 0 and prev and not heading and not prev["heading"]
+                    and prev["page"] < page_num and not prev["text"].endswith(SENTENCE_CLOSERS)):
+                # The previous page ended mid-sentence: this paragraph continues it.
+                prev["text"] += " " + sentences.pop(0)
+                prev["end_page"] = page_num
+            for i, sentence in enumerate(sentences):
+                units.append({
+                    "text": sentence,
+                    "page": page_num,
+                    "end_page": page_num,
+                    "heading": heading,
+                    "para": i == 0
+                })
+    return units
+
+def split_long_unit(unit, tokens, max_tokens):
+    """
+    Cuts a unit longer than max_tokens into word windows of about max_tokens.
+    """
+    words = unit["text"].split()
+    step = max(1, len(words) * max_tokens // max(tokens, 1))
+    pieces = [dict(unit, text=" ".join(words[i:i + step]), para=unit["para"] and i == 0)
+              for i in range(0, len(words), step)]
+    return pieces, count_tokens([p["text"] for p in pieces])
+
+def chunk_pages(page_texts, headings=None, max_tokens=None, overlap_tokens=None, min_tokens=None):
+    """
+    Splits a document into chunks of at most max_tokens embedding-model tokens:
+      1. Break the pages into headings and sentences (document_units), keeping
+         sentences that straddle a page break together.
+      2. Fill each chunk with whole sentences; start a new chunk at a heading once
+         the current one has min_tokens, so a chunk rarely spans two sections.
+      3. Start each following chunk with the last sentences of the previous one,
+         up to overlap_tokens.
+    Returns [{"text", "page_number", "end_page"}].
+    """
+    max_tokens = max_tokens or CHUNK_TOKENS
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    min_tokens = CHUNK_MIN_TOKENS if min_tokens is None else min_tokens
+
+    units = document_units(page_texts, headings)
+    tokens = count_tokens([u["text"] for u in units]) if units else []
+    sized = []
+    for unit, n in zip(units, tokens):
+        if n > max_tokens:
+            sized.extend(zip(*split_long_unit(unit, n, max_tokens)))
         else:
-            if current_chunk:
-                chunks.append(" ".join(current_chunk))
-                current_chunk = []
-                current_count = 0
-            if word_count > max_words:
-                sentences = re.split(r'(?<=[.!?])\s+', para)
-                temp_chunk = []
-                temp_count = 0
-                for sent in sentences:
-                    sent_count = len(sent.split())
-                    if temp_count + sent_count <= max_words:
-                        temp_chunk.append(sent)
-                        temp_count += sent_count
-                    else:
-                        if temp_chunk:
-                            chunks.append(" ".join(temp_chunk))
-                        temp_chunk = [sent]
-                        temp_count = sent_count
-                if temp_chunk:
-                    chunks.append(" ".join(temp_chunk))
-            else:
-                current_chunk.append(para)
-                current_count += word_count
-    if current_chunk:
-        chunks.append(" ".join(current_chunk))
+            sized.append((unit, n))
+
+    chunks = []
+    current, used = [], 0
+    fresh = 0  # units in current that are not overlap from the previous chunk
+
+    def flush(keep_overlap):
+        nonlocal current, used, fresh
+        if not fresh:
+            # Only overlap left: it is already the end of the previous chunk.
+            if not keep_overlap:
+                current, used = [], 0
+            return
+        text = current[0][0]["text"]
+        for unit, _ in current[1:]:
+            text += ("\n" if unit["para"] or unit["heading"] else " ") + unit["text"]
+        chunks.append({
+            "text": text,
+            "page_number": current[0][0]["page"],
+            "end_page": current[-1][0]["end_page"]
+        })
+        carry, carried = [], 0
+        if keep_overlap:
+            for unit, n in reversed(current[1:]):
+                if carried + n > overlap_tokens:
+                    break
+                carry.insert(0, (unit, n))
+                carried += n
+        current, used, fresh = carry, carried, 0
+
+    for unit, n in sized:
+        if unit["heading"] and used >= min_tokens:
+            flush(keep_overlap=False)
+        elif used + n > max_tokens:
+            flush(keep_overlap=True)
+            if used + n > max_tokens:
+                current, used = [], 0
+        current.append((unit, n))
+        used += n
+        fresh += 1
+    flush(keep_overlap=False)
     return chunks
 
 def process_and_get_image_description(image_file):
@@ -184,30 +307,139 @@ def process_images_and_update_page_data(pdf_path, output_folder, page_data):
     total_images = sum(len(data.get("images", [])) for data in updated_page_data.values())
     return updated_page_data, total_images
 
-def add_chunks_to_chromadb(collection, pdf_name, page_num, chunks):
+def add_documents_to_chromadb(collection, documents, metadatas, ids):
+    """
+    Inserts prepared documents through the shared, serialized writer.
+    """
+    if not documents:
+        return 0
+    with _chroma_write_lock:
+        collection.add(
+            documents=documents,
+            metadatas=metadatas,
+            ids=ids
+        )
+    return len(documents)
+
+def remove_source_chunks(collection, source_file):
+    """
+    Deletes whatever an earlier ingestion of this file put in the collection, so
+    re-ingesting a changed file replaces its chunks instead of leaving stale ones
+    (and cached answers built on them are invalidated).
+    """
+    with _chroma_write_lock:
+        collection.delete(where={"source_file": source_file})
+
+def add_chunks_to_chromadb(collection, pdf_name, chunks):
+    """
+    Adds a document's chunks (from chunk_pages) to the collection and returns how
+    many were added. chunk_index counts through the whole document; page_number
+    is the page a chunk starts on and end_page the one it ends on.
+    """
     if not chunks:
-        return
+        return 0
     documents_to_add = []
     metadatas_to_add = []
     ids_to_add = []
     for i, chunk in enumerate(chunks):
-        if not chunk.strip():
+        if not chunk["text"].strip():
             continue
-        doc_id = f"{pdf_name}_page_{page_num}_chunk_{i}_text"
-        documents_to_add.append(chunk)
+        doc_id = f"{pdf_name}_page_{chunk['page_number']}_chunk_{i}_text"
+        documents_to_add.append(chunk["text"])
         metadatas_to_add.append({
             "source_file": pdf_name,
-            "page_number": page_num,
+            "page_number": chunk["page_number"],
+            "end_page": chunk["end_page"],
             "chunk_index": i,
             "type": "text"
         })
         ids_to_add.append(doc_id)
-    if documents_to_add:
-        collection.add(
-            documents=documents_to_add,
-            metadatas=metadatas_to_add,
-            ids=ids_to_add
-        )
+    return add_documents_to_chromadb(collection, documents_to_add, metadatas_to_add, ids_to_add)
+
+def read_toc(pdf_path):
+    """
+    The PDF outline as [level, title, page] entries (pages 1-based), or [].
+    """
+    try:
+        import fitz
+        with fitz.open(pdf_path) as doc:
+            return doc.get_toc(simple=True)
+    except Exception as e:
+        print(f"[Sections] Could not read the outline of {pdf_path}: {e}")
+        return []
+
+def section_ranges(toc, page_numbers):
+    """
+    (title, first_page, last_page) for every outline entry up to SECTION_TOC_LEVEL,
+    or one section per page if there is no usable outline.
+    """
+    pages = sorted(page_numbers)
+    if not pages:
+        return []
+    last = pages[-1]
+    starts = []
+    for level, title, page in sorted((e for e in toc if e[0] <= SECTION_TOC_LEVEL), key=lambda e: e[2]):
+        if not 1 <= page <= last:
+            continue
+        if starts and starts[-1][1] == page:
+            # Several headings on one page form one section.
+            starts[-1] = (f"{starts[-1][0]} / {title.strip()}", page)
+        else:
+            starts.append((title.strip(), page))
+    if not starts:
+        return [(f"Page {p}", p, p) for p in pages]
+    if starts[0][1] > pages[0]:
+        starts.insert(0, ("Front matter", pages[0]))
+
+    ranges = []
+    for i, (title, start) in enumerate(starts):
+        end = starts[i + 1][1] - 1 if i + 1 < len(starts) else last
+        for first in range(start, end + 1, SECTION_MAX_PAGES):
+            ranges.append((title, first, min(end, first + SECTION_MAX_PAGES - 1)))
+    return ranges
+
+def extractive_summary(title, texts, max_words):
+    """
+    The title plus sentences taken round-robin from the section's pages (each
+    page's first sentence, then each page's second, ...) up to max_words.
+    """
+    per_page = [
+        [s for s in re.split(r'(?<=[.!?])\s+', " ".join(text.split())) if len(s.split()) >= 4]
+        for text in texts
+    ]
+    picked, words = [], len(title.split())
+    for rank in range(max((len(p) for p in per_page), default=0)):
+        for sentences in per_page:
+            if rank >= len(sentences):
+                continue
+            count = len(sentences[rank].split())
+            if words + count > max_words:
+                return f"{title}: {' '.join(picked)}"
+            picked.append(sentences[rank])
+            words += count
+    return f"{title}: {' '.join(picked)}"
+
+def add_sections_to_chromadb(collection, source_file, page_texts, toc=()):
+    """
+    Replaces the section summaries of one file in the section index and returns
+    how many were added.
+    """
+    remove_source_chunks(collection, source_file)
+    documents, metadatas, ids = [], [], []
+    for i, (title, first, last) in enumerate(section_ranges(toc, page_texts.keys())):
+        texts = [page_texts[p] for p in range(first, last + 1) if page_texts.get(p, "").strip()]
+        if not texts:
+            continue
+        documents.append(extractive_summary(title, texts, SECTION_SUMMARY_WORDS))
+        metadatas.append({
+            "source_file": source_file,
+            "section_title": title,
+            "start_page": first,
+            "end_page": last,
+            "type": "section"
+        })
+        ids.append(f"{source_file}_section_{i}")
+    return add_documents_to_chromadb(collection, documents, metadatas, ids)
 
 def add_image_pointers_with_descriptions(page_texts, page_data):
     """
@@ -229,23 +461,34 @@ def add_image_pointers_with_descriptions(page_texts, page_data):
             else:
                 marker = f"<IMAGE|{img_file_name}>"
             if page_num in page_texts:
-                page_texts[page_num] += "\n" + marker
+                page_texts[page_num] += "\n\n" + marker
     return page_texts
 
-def process_pdf(pdf_path, collection=None):
+def process_pdf(pdf_path, collection=None, executor=None, sections=None, source_name=None):
     """
     1) Extract text, images, audio, and tables from the PDF
     2) Insert chunked text into the specified ChromaDB collection
+       (and one summary per outline section/page into `sections`, if given)
     3) All extracted content (images, etc.) goes into chat session folder
+
+    If `executor` is given (the shared pool used for directory ingestion),
+    the extraction steps are scheduled on it instead of a private pool.
+    Returns (image_count, audio_count, chunk_count).
     """
     # Use the chat session folder from environment variables
     session_folder = os.getenv("CHROMA_DB_DIR", "database/chat_unknown")
-    pdf_name, output_folder = setup_output_folder(pdf_path, session_folder)
+    pdf_name, output_folder = setup_output_folder(pdf_path, session_folder, source_name)
+
+    if executor is None:
+        pool = concurrent.futures.ProcessPoolExecutor()
+    else:
+        pool = contextlib.nullcontext(executor)
 
-    with concurrent.futures.ProcessPoolExecutor() as executor:
+    with pool as executor:
         futures = {}
         print("[Step 1] Extracting text...")
         futures['text'] = executor.submit(extract_text, pdf_path)
+        futures['headings'] = executor.submit(extract_headings, pdf_path)
 
         print("[Step 2] Extracting metadata/links...")
         futures['metadata'] = executor.submit(extract_metadata_and_links_with_text, pdf_path)
@@ -266,9 +509,14 @@ def process_pdf(pdf_path, collection=None):
         tables_with_metadata = futures['tables'].result()
         updated_page_data, image_count = futures['images'].result()
         audio_info = futures['audio'].result()
+        try:
+            headings = futures['headings'].result()
+        except Exception as e:
+            print(f"[Step 1] Could not detect headings: {e}")
+            headings = {}
 
         # Clean up references
-        del futures['text'], futures['tables'], futures['images'], futures['audio']
+        del futures['text'], futures['tables'], futures['images'], futures['audio'], futures['headings']
 
     page_data.update(updated_page_data)
     page_data.update(audio_info)
@@ -285,10 +533,32 @@ def process_pdf(pdf_path, collection=None):
     print(f"[Complete] Finished. Extracted {image_count} images.")
 
     # Insert chunked text into Chroma if collection provided
+    chunk_count = 0
     if collection:
-        for page_num, text in page_texts.items():
-            chunks = chunk_text_semantic(text, max_words=200)
-            add_chunks_to_chromadb(collection, pdf_name, page_num, chunks)
+        remove_source_chunks(collection, pdf_name)
+        chunks = chunk_pages(page_texts, headings)
+        chunk_count = add_chunks_to_chromadb(collection, pdf_name, chunks)
+    if sections is not None:
+        section_count = add_sections_to_chromadb(sections, pdf_name, page_texts, read_toc(pdf_path))
+        print(f"[Sections] Indexed {section_count} sections of {pdf_name}.")
 
     # Return some metrics
-    return image_count, 0
+    return image_count, 0, chunk_count
+
+def process_native_document(file_path, collection=None, sections=None, source_name=None):
+    """
+    Fast path for text-like files and images: extract the text directly and feed
+    the same chunk/embed stage as process_pdf, without converting to PDF first.
+    Returns (image_count, audio_count, chunk_count) like process_pdf.
+    """
+    name = source_name or os.path.splitext(os.path.basename(file_path))[0]
+    page_texts, headings = extract_pages_with_headings(file_path)
+    image_count = 1 if os.path.splitext(file_path)[1].lower() in IMAGE_EXTENSIONS else 0
+
+    chunk_count = 0
+    if collection:
+        remove_source_chunks(collection, name)
+        chunk_count = add_chunks_to_chromadb(collection, name, chunk_pages(page_texts, headings))
+    if sections is not None:
+        add_sections_to_chromadb(sections, name, page_texts)
+    return image_count, 0, chunk_count
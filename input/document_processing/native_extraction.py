@@ -0,0 +1,178 @@
+import os
+import re
+from pathlib import Path
+from html.parser import HTMLParser
+
+TEXT_EXTENSIONS = ['.txt']
+MARKDOWN_EXTENSIONS = ['.md', '.markdown']
+HTML_EXTENSIONS = ['.html', '.htm']
+DOCX_EXTENSIONS = ['.docx']
+IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg']
+NATIVE_EXTENSIONS = TEXT_EXTENSIONS + MARKDOWN_EXTENSIONS + HTML_EXTENSIONS + DOCX_EXTENSIONS + IMAGE_EXTENSIONS
+
+def read_text_file(file_path):
+    """
+    Reads a text file as UTF-8, falling back to a lossless single-byte decode.
+    """
+    try:
+        with open(file_path, "r", encoding="utf-8-sig") as f:
+            return f.read()
+    except UnicodeDecodeError:
+        with open(file_path, "r", encoding="latin-1") as f:
+            return f.read()
+
+def normalize_paragraphs(text):
+    """
+    Joins hard-wrapped lines inside a paragraph and keeps blank lines between
+    paragraphs, which is what main_multi.chunk_pages splits on.
+    """
+    paragraphs = re.split(r'\n\s*\n', text.replace("\r\n", "\n"))
+    cleaned = [" ".join(line.strip() for line in p.splitlines() if line.strip()) for p in paragraphs]
+    return "\n\n".join(p for p in cleaned if p)
+
+def strip_emphasis(text):
+    text = re.sub(r'(\*\*|\*|`)(\S(?:.*?\S)?)\1', r'\2', text)
+    return re.sub(r'(?<!\w)(__|_)(\S(?:.*?\S)?)\1(?!\w)', r'\2', text)
+
+def extract_plain_text(file_path):
+    return normalize_paragraphs(read_text_file(file_path)), []
+
+def extract_markdown(file_path):
+    """
+    Strips Markdown syntax but keeps headings and code as their own paragraphs.
+    Returns (text, headings).
+    """
+    headings = []
+    def heading(match):
+        title = strip_emphasis(match.group(1))
+        if title:
+            headings.append(title)
+        return f"\n{match.group(1)}\n"
+
+    text = read_text_file(file_path)
+    text = re.sub(r'^```.*$', '', text, flags=re.MULTILINE)
+    text = re.sub(r'!\[([^\]]*)\]\([^)]*\)', r'\1', text)
+    text = re.sub(r'\[([^\]]+)\]\([^)]*\)', r'\1', text)
+    text = re.sub(r'^\s{0,3}#{1,6}\s*(.*?)\s*#*\s*$', heading, text, flags=re.MULTILINE)
+    text = re.sub(r'^\s{0,3}(?:[-*+]|\d+[.)])\s+', '\n', text, flags=re.MULTILINE)
+    text = re.sub(r'^\s{0,3}>\s?', '', text, flags=re.MULTILINE)
+    return normalize_paragraphs(strip_emphasis(text)), headings
+
+class HeadingParser(HTMLParser):
+    """
+    Collects the text of every h1-h6 element.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.headings = []
+        self._current = None
+
+    def handle_starttag(self, tag, attrs):
+        if re.fullmatch(r'h[1-6]', tag):
+            self._current = []
+
+    def handle_endtag(self, tag):
+        if re.fullmatch(r'h[1-6]', tag) and self._current is not None:
+            title = " ".join("".join(self._current).split())
+            if title:
+                self.headings.append(title)
+            self._current = None
+
+    def handle_data(self, data):
+        if self._current is not None:
+            self._current.append(data)
+
+def html_headings(html):
+    parser = HeadingParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        pass
+    return parser.headings
+
+def extract_html(file_path):
+    """
+    Main-content extraction with trafilatura, BeautifulSoup for pages it rejects.
+    Returns (text, headings).
+    """
+    html = read_text_file(file_path)
+    headings = html_headings(html)
+    try:
+        import trafilatura
+        extracted = trafilatura.extract(html, include_comments=False, include_tables=True)
+        if extracted:
+            return normalize_paragraphs(extracted.replace("\n", "\n\n")), headings
+    except ImportError:
+        pass
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(["script", "style", "noscript"]):
+        tag.decompose()
+    return normalize_paragraphs(soup.get_text("\n\n")), headings
+
+def extract_docx(file_path):
+    """
+    Paragraphs and tables of a .docx in document order; table rows become 'a | b | c'.
+    Returns (text, headings), the headings being the Title and Heading-styled paragraphs.
+    """
+    import docx
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    document = docx.Document(file_path)
+    parts, headings = [], []
+    for element in document.element.body.iterchildren():
+        tag = element.tag.rsplit('}', 1)[-1]
+        if tag == "p":
+            paragraph = Paragraph(element, document)
+            text = paragraph.text.strip()
+            if text:
+                parts.append(text)
+                style = paragraph.style.name if paragraph.style is not None else ""
+                if style.startswith(("Heading", "Title")):
+                    headings.append(text)
+        elif tag == "tbl":
+            rows = []
+            for row in Table(element, document).rows:
+                cells = [cell.text.strip() for cell in row.cells]
+                rows.append(" | ".join(cells))
+            if rows:
+                parts.append("\n".join(rows))
+    return "\n\n".join(parts), headings
+
+def extract_image(file_path):
+    """
+    Captions the image directly and returns the same marker the PDF path inserts.
+    """
+    from image_processing import ollama_images
+    desc_text = (ollama_images.process_image(file_path) or "").strip()
+    img_file_name = os.path.basename(str(file_path))
+    if desc_text:
+        return f"<IMAGE|{img_file_name}|Desc: {desc_text}>", []
+    return f"<IMAGE|{img_file_name}>", []
+
+def extract_pages_with_headings(file_path):
+    """
+    Returns ({page_number: text}, {page_number: [heading, ...]}) for a natively
+    supported file, the same shapes extract_text_without_repetitions and
+    extract_headings produce for PDFs. These formats have no pages, so the whole
+    document is page 1.
+    """
+    ext = Path(file_path).suffix.lower()
+    if ext in TEXT_EXTENSIONS:
+        text, headings = extract_plain_text(file_path)
+    elif ext in MARKDOWN_EXTENSIONS:
+        text, headings = extract_markdown(file_path)
+    elif ext in HTML_EXTENSIONS:
+        text, headings = extract_html(file_path)
+    elif ext in DOCX_EXTENSIONS:
+        text, headings = extract_docx(file_path)
+    elif ext in IMAGE_EXTENSIONS:
+        text, headings = extract_image(file_path)
+    else:
+        raise ValueError(f"No native extractor for {ext} files")
+    if not text.strip():
+        return {}, {}
+    return {1: text}, ({1: headings} if headings else {})
@@ -1,11 +1,21 @@
+import re
 import fitz  # PyMuPDF
 import pdfplumber
 from collections import defaultdict
 import os
 
+def block_text(text):
+    """
+    A PyMuPDF text block as one paragraph: hard line wraps (and words hyphenated
+    across them) are joined.
+    """
+    text = re.sub(r'(?<=[a-z])-\n(?=[a-z])', '', text.strip())
+    return " ".join(text.split())
+
 def extract_text_without_repetitions(pdf_path):
     """
     Extracts text from each page without repetitive headers/footers.
+    Every text block becomes one paragraph; paragraphs are separated by a blank line.
     Falls back to pdfplumber if PyMuPDF fails to retrieve text.
     """
     doc = fitz.open(pdf_path)
@@ -24,33 +34,63 @@ def extract_text_without_repetitions(pdf_path):
 
     threshold = total_pages * 0.8
     common_texts = {text for text, count in repetitive_texts.items() if count >= threshold}
+    if total_pages < 2:
+        common_texts = set()
 
     # Second pass: Extract and clean text for each page
     for i in range(total_pages):
         page = doc.load_page(i)
         blocks = page.get_text("blocks")
-        
-        # Try basic extraction if only one block or no repetitive content is detected
-        if len(blocks) == 1 or not common_texts:
-            extracted_text = page.get_text("text").strip()
-            if extracted_text:  # If text is successfully extracted
-                page_texts[i + 1] = extracted_text
-            else:
-                page_texts[i + 1] = fallback_extract_with_pdfplumber(pdf_path, i)  # Use pdfplumber if no text
-            continue
-
-        # Apply repetitive text filtering
-        cleaned_page_text = []
-        for block in blocks:
-            block_text = block[4].strip()
-            if block_text and block_text not in common_texts:
-                cleaned_page_text.append(block_text)
 
-        combined_text = "\n".join(cleaned_page_text).strip()
+        # Block type 1 is an image; its "text" is only a description of the bitmap.
+        paragraphs = [
+            block_text(block[4]) for block in blocks
+            if block[6] == 0 and block[4].strip() and block[4].strip() not in common_texts
+        ]
+        combined_text = "\n\n".join(p for p in paragraphs if p)
         page_texts[i + 1] = combined_text if combined_text else fallback_extract_with_pdfplumber(pdf_path, i)
 
     return page_texts
 
+def extract_headings(pdf_path, size_ratio=1.15, max_words=15):
+    """
+    Returns {page_number: [heading, ...]} with the text of the blocks that look
+    like headings: short, not ending in a full stop, and set in a font at least
+    size_ratio times the body size (the size most characters use) or all bold.
+    """
+    doc = fitz.open(pdf_path)
+    pages = []
+    size_chars = defaultdict(int)
+    for i in range(doc.page_count):
+        page_blocks = []
+        for block in doc.load_page(i).get_text("dict")["blocks"]:
+            if block.get("type") != 0:
+                continue
+            spans = [span for line in block["lines"] for span in line["spans"] if span["text"].strip()]
+            if not spans:
+                continue
+            for span in spans:
+                size_chars[round(span["size"], 1)] += len(span["text"])
+            text = block_text("\n".join(
+                "".join(span["text"] for span in line["spans"]) for line in block["lines"]
+            ))
+            page_blocks.append((text, max(span["size"] for span in spans), all(span["flags"] & 16 for span in spans)))
+        pages.append(page_blocks)
+    if not size_chars:
+        return {}
+
+    body_size = max(size_chars, key=size_chars.get)
+    headings = {}
+    for i, page_blocks in enumerate(pages):
+        found = [
+            text for text, size, bold in page_blocks
+            if text and len(text.split()) <= max_words and not text.endswith(".")
+            and (size >= body_size * size_ratio or bold)
+        ]
+        if found:
+            headings[i + 1] = found
+    return headings
+
 def fallback_extract_with_pdfplumber(pdf_path, page_num):
     """
     Attempts to extract text from a specific page using pdfplumber as a fallback.
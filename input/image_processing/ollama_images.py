@@ -1,21 +1,31 @@
 import os
-import ollama
+import sys
 from pathlib import Path
 
+# input.py runs as its own script; make core.* importable for the LLM gate.
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import core.config as config
+from core import llm
+
 def process_image(image_path):
     image_path = str(image_path)
     output_dir = os.path.dirname(image_path)
 
     if image_path.lower().endswith(('.png', '.jpg', '.jpeg')):
-        res = ollama.chat(
-            model='llava-llama3:latest',
-            messages=[
+        # Explicit model: a text-only fallback could not read the image.
+        res = llm.chat(
+            [
                 {
                     'role': 'user',
                     'content': 'Describe this image in great detail, if there is any text then extract them all in a meaningful way',
                     'images': [image_path]
                 }
-            ]
+            ],
+            model=config.IMAGE_MODEL,
+            task="image"
         )
         
         description = res['message']['content']
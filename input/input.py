@@ -1,10 +1,19 @@
 import os
 import re
 import sys
+import time
 import subprocess
+import concurrent.futures
 from pathlib import Path
 
+# core.* lives one level up; input.py runs as its own script.
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from core.config import sections_collection_name
 from document_processing import main_multi, document_to_pdf as documents_to_pdf
+from document_processing.native_extraction import NATIVE_EXTENSIONS
 from image_processing import ollama_images
 from audio_processing.whisper_medium import process_audio
 
@@ -26,6 +35,11 @@ class ChromaEmbeddingFunction:
 
 embedding_function = ChromaEmbeddingFunction()
 
+# Directory ingestion: 0 means "size the pool from CPU count and free memory".
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0"))
+# Rough peak resident memory of one extraction worker (PyMuPDF + pdfplumber).
+INGEST_WORKER_MEMORY_MB = int(os.getenv("INGEST_WORKER_MEMORY_MB", "768"))
+
 def sanitize_collection_name(name):
     """
     Sanitize a PDF base name to meet ChromaDB collection name requirements:
@@ -53,56 +67,183 @@ def process_input(input_path):
     """
     input_path = Path(input_path)
     if input_path.is_dir():
-        for file in input_path.rglob('*'):
-            if file.is_file():
-                process_file(file)
+        process_directory(input_path)
     elif input_path.is_file():
         process_file(input_path)
     else:
         print(f"Invalid input path: {input_path}")
 
-def process_file(file_path):
+def available_memory_mb():
+    """
+    Returns the memory currently available to new processes in MB,
+    or None if it cannot be determined on this platform.
+    """
+    try:
+        import psutil
+        return psutil.virtual_memory().available // (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        with open("/proc/meminfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return None
+
+def default_worker_count():
+    """
+    One worker per CPU, capped so that all workers fit in the available memory.
+    """
+    if INGEST_WORKERS > 0:
+        return INGEST_WORKERS
+    workers = os.cpu_count() or 1
+    mem_mb = available_memory_mb()
+    if mem_mb is not None:
+        workers = min(workers, max(1, mem_mb // INGEST_WORKER_MEMORY_MB))
+    return max(1, workers)
+
+def process_directory(dir_path, workers=None):
+    """
+    Ingests every file below dir_path into one collection named after the folder.
+
+    Whole files are scheduled concurrently; their CPU-heavy extraction steps share
+    a single process pool and all chunks are embedded by the one embedding model
+    of this process. Prints a per-file summary and an aggregate throughput report.
+    """
+    dir_path = Path(dir_path)
+    # Materialize the listing first: conversions write new PDFs next to their sources.
+    files = sorted(p for p in dir_path.rglob('*') if p.is_file())
+    if not files:
+        print(f"[Ingest] No files found in {dir_path}")
+        return []
+
+    workers = workers or default_worker_count()
+    collection = client.get_or_create_collection(
+        name=sanitize_collection_name(dir_path.name),
+        embedding_function=embedding_function
+    )
+    # Created once here, before the worker threads only look it up.
+    get_sections_collection(collection)
+    print(f"[Ingest] Ingesting {len(files)} files from {dir_path} with {workers} workers...")
+
+    def run(file_path):
+        start = time.perf_counter()
+        # Files share one collection, so they are keyed by their path in the folder
+        # (week1/notes.pdf vs week2/notes.pdf), not by their bare names.
+        source_name = file_path.relative_to(dir_path).as_posix()
+        result = {"file": source_name, "bytes": file_path.stat().st_size}
+        try:
+            result["chunks"] = process_file(
+                file_path, collection=collection, executor=pool, source_name=source_name
+            ) or 0
+            result["status"] = "ok"
+        except Exception as e:
+            result["chunks"] = 0
+            result["status"] = "failed"
+            result["error"] = str(e)
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    started = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=workers) as scheduler:
+        results = list(scheduler.map(run, files))
+    elapsed = time.perf_counter() - started
+
+    print_ingest_report(results, elapsed)
+    return results
+
+def print_ingest_report(results, elapsed):
+    print("\n[Ingest] Per-file summary:")
+    for r in results:
+        line = f"  {r['status'].upper():<6} {r['seconds']:7.1f}s {r['chunks']:6d} chunks  {r['file']}"
+        if r.get("error"):
+            line += f"  ({r['error']})"
+        print(line)
+
+    ok = sum(1 for r in results if r["status"] == "ok")
+    chunks = sum(r["chunks"] for r in results)
+    megabytes = sum(r["bytes"] for r in results) / (1024 * 1024)
+    elapsed = max(elapsed, 1e-6)
+    print(
+        f"[Ingest] {len(results)} files ({ok} ok, {len(results) - ok} failed), "
+        f"{chunks} chunks, {megabytes:.1f} MB in {elapsed:.1f}s -> "
+        f"{len(results) / elapsed:.2f} files/s, {megabytes / elapsed:.2f} MB/s, "
+        f"{chunks / elapsed:.1f} chunks/s"
+    )
+
+def process_file(file_path, collection=None, executor=None, source_name=None):
     """
     Checks the extension of the file and dispatches the appropriate
-    processing function.
+    processing function. Returns the number of chunks added.
+    `source_name` keys the file's chunks, ids and output folder (default: file name without extension).
     """
     file_extension = file_path.suffix.lower()
-    if file_extension in ['.png', '.jpg', '.jpeg']:
-        print(f"Processing image: {file_path}")
-        pdf_path = documents_to_pdf.convert_to_pdf(file_path)
-        if pdf_path is None:
-            print(f"Failed to convert {file_path} to PDF.")
-            return
-        process_pdf_file(pdf_path)
+    if file_extension in NATIVE_EXTENSIONS:
+        print(f"Processing {file_extension} file directly: {file_path}")
+        return process_native_file(file_path, collection, source_name)
 
     elif file_extension == '.pdf':
         print(f"Processing PDF: {file_path}")
-        process_pdf_file(file_path)
+        return process_pdf_file(file_path, collection, executor, source_name)
 
     elif file_extension in ['.wav', '.mp3', '.flac', '.ogg']:
         print(f"Processing audio: {file_path}")
-        process_audio(file_path)
+        return process_audio(file_path, collection or get_file_collection(file_path), source_name)
     else:
         print(f"Converting {file_path} to PDF...")
         pdf_path = documents_to_pdf.convert_to_pdf(file_path)
         if pdf_path is not None and pdf_path.exists():
             print(f"Conversion successful. Processing converted PDF: {pdf_path}")
-            process_pdf_file(pdf_path)
+            return process_pdf_file(pdf_path, collection, executor, source_name)
         else:
             print(f"Conversion failed or unsupported file format: {file_path}")
+            return 0
 
-def process_pdf_file(pdf_path):
+def get_file_collection(file_path):
     """
-    1) Create or retrieve a ChromaDB collection for this PDF.
-    2) Call main_multi.process_pdf to handle text, images, and chunk insertion.
+    Creates or retrieves the ChromaDB collection named after a single file.
     """
-    pdf_name = Path(pdf_path).stem
-    sanitized_name = sanitize_collection_name(pdf_name)
-    pdf_collection = client.get_or_create_collection(
+    sanitized_name = sanitize_collection_name(Path(file_path).stem)
+    return client.get_or_create_collection(
         name=sanitized_name,
         embedding_function=embedding_function
     )
-    image_count, audio_count = main_multi.process_pdf(pdf_path, pdf_collection)
+
+def get_sections_collection(collection):
+    """
+    Creates or retrieves the section index that belongs to a document collection.
+    """
+    return client.get_or_create_collection(
+        name=sections_collection_name(collection.name),
+        embedding_function=embedding_function
+    )
+
+def process_native_file(file_path, collection=None, source_name=None):
+    """
+    Text, Markdown, HTML, DOCX and images skip the PDF conversion and go
+    straight to main_multi's chunk/embed stage.
+    """
+    if collection is None:
+        collection = get_file_collection(file_path)
+    image_count, audio_count, chunk_count = main_multi.process_native_document(
+        str(file_path), collection, get_sections_collection(collection), source_name
+    )
+    return chunk_count
+
+def process_pdf_file(pdf_path, collection=None, executor=None, source_name=None):
+    """
+    1) Create or retrieve a ChromaDB collection for this PDF (unless one is given).
+    2) Call main_multi.process_pdf to handle text, images, and chunk insertion.
+    """
+    if collection is None:
+        collection = get_file_collection(pdf_path)
+    image_count, audio_count, chunk_count = main_multi.process_pdf(
+        pdf_path, collection, executor, get_sections_collection(collection), source_name
+    )
+    return chunk_count
 
 if __name__ == '__main__':
     if len(sys.argv) > 1:
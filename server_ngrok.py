@@ -9,7 +9,7 @@ from flask_cors import CORS
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import urllib.parse
-from core import db_utils, chat, config
+from core import db_utils, chat, config, memory
 from core.learning_mode import LearningModeAgent
 import traceback
 
@@ -157,6 +157,7 @@ def chat_endpoint():
     answer = chat.master_answer_flow(user_message)
     db_utils.chat_history.append({"role": "assistant", "content": answer})
     db_utils.save_session_state()
+    memory.index_history(db_utils.chat_history)
     print("[Server] Chat endpoint processed message.")
     return jsonify({"response": answer}), 200
 
@@ -191,6 +192,27 @@ def start_learning_mode():
 
 
 
+@app.route("/api/mcq", methods=["POST"])
+def generate_mcq():
+    data  = request.get_json() or {}
+    topic = (data.get("topic") or "").strip() or None
+    title = (data.get("title") or "").strip()
+    save  = bool(data.get("save", True))
+    chat_history_file = os.environ.get("CHAT_HISTORY_FILE", "")
+    session_folder = os.path.dirname(os.path.abspath(chat_history_file)) if chat_history_file else None
+    from core import mcq
+    try:
+        quiz = mcq.generate_quiz(topic=topic, title=title, session_folder=session_folder, save=save)
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": f"MCQ generation failed: {str(e)}"}), 500
+    if not quiz["mcqs"]:
+        status = 404 if quiz["error"] == "No text found to generate MCQs" else 502
+        return jsonify({"error": quiz["error"]}), status
+    print(f"[Server] Generated {len(quiz['mcqs'])} MCQs: {quiz['title']}")
+    return jsonify(quiz), 200
+
+
 @app.route("/api/database/export", methods=["GET"])
 def export_database():
     if not os.path.isdir(DATABASE_ROOT):
@@ -481,6 +503,8 @@ def list_root_folders():
         return jsonify({"error": f"Could not list folders: {str(e)}"}), 500
 
 if __name__ == "__main__":
+    from core import rerank
+    rerank.warm_up()
     observer = Observer()
     event_handler = DatabaseChangeHandler()
     observer.schedule(event_handler, path=DATABASE_ROOT, recursive=True)
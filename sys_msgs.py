@@ -54,3 +54,17 @@ web_query_generator_msg = (
     "Do not simply repeat the conversation verbatim or duplicate the current query. "
     "Output only the final search query text without any quotation marks or extra commentary."
 )
+
+search_planner_msg = (
+    "You are a search planning agent. Given the recent conversation, the previous external search query (if any) and "
+    "the user's current message, decide in one step whether external information is needed and how to get it. "
+    "Set needs_search to false for greetings, casual conversation or anything answerable from general knowledge that "
+    "does not change over time; set it to true if the message refers to recent events, current updates or information "
+    "that may not be covered by existing knowledge. "
+    "When searching, write a concise search-engine query in 'query': combine it with the previous search query only if "
+    "the current message is a follow-up to it, do not repeat the conversation verbatim, use no quotation marks, and "
+    "include no specific dates unless the user gave one. "
+    "Set 'source' to 'news' for current events or recent updates and 'wiki' for general or historical information; "
+    "when in doubt, use 'news'. "
+    'Respond with JSON only, exactly in the form {"needs_search": true, "query": "...", "source": "news"}.'
+)
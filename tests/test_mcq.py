@@ -0,0 +1,50 @@
+import pytest
+
+pytest.importorskip("chromadb")
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("ollama")
+
+from core.mcq import validate_mcq, parse_mcq_output
+
+
+def test_answer_text_starting_with_a_is_not_letter_a():
+    mcq = validate_mcq({
+        "question": "What surrounds a plant cell?",
+        "options": ["Cell membrane", "A cell wall", "Nucleus", "Ribosome"],
+        "answer": "A cell wall",
+    })
+    assert mcq["answer"] == "B"
+
+
+def test_letter_answers():
+    options = ["Cell membrane", "A cell wall", "Nucleus", "Ribosome"]
+    for answer, letter in [("C", "C"), ("c", "C"), ("D) Ribosome", "D"), ("B.", "B")]:
+        assert validate_mcq({"question": "Q?", "options": options, "answer": answer})["answer"] == letter
+
+
+def test_option_text_is_not_mistaken_for_a_prefix():
+    mcq = validate_mcq({
+        "question": "Which organism is a nematode?",
+        "options": ["E. coli", "S. cerevisiae", "C. elegans", "D. melanogaster"],
+        "answer": "C. elegans",
+    })
+    assert mcq["options"][2] == "C) C. elegans"
+    assert mcq["answer"] == "C"
+
+
+def test_lettered_options_are_stripped():
+    mcq = validate_mcq({
+        "question": "Q?",
+        "options": ["A) one", "B) two", "C) three", "D) four"],
+        "answer": "B",
+    })
+    assert mcq["options"] == ["A) one", "B) two", "C) three", "D) four"]
+
+
+def test_legacy_parser_matches_answer_text():
+    raw = (
+        "1. What surrounds a plant cell?\n"
+        "A) Cell membrane\nB) A cell wall\nC) Nucleus\nD) Ribosome\n"
+        "Answer: A cell wall\nExplanation: Plants have walls.\n"
+    )
+    assert parse_mcq_output(raw)[0]["answer"] == "B"